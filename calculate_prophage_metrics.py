@@ -12,17 +12,30 @@ import argparse
 import csv
 import os
 import math
-import re
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
+
+# Bytes read per block when scanning FASTA files
+READ_BLOCK_SIZE = 1 << 20
+
+# Coordinate values accepted in the predictions file
+INTEGER_PATTERN = r'[+-]?[0-9]+'
+
 
 def normalize_genome_id(genome_id):
     """
     Normalize genome ID by removing version number suffix (.1, .2, etc.)
     Example: NC_023149.1 -> NC_023149
     """
-    return re.sub(r'\.\d+$', '', genome_id)
+    # Equivalent to re.sub(r'\.\d+$', '', genome_id) without the regex engine
+    dot = genome_id.rfind('.')
+    if dot >= 0 and genome_id[dot + 1:].isdecimal():
+        return genome_id[:dot]
+    return genome_id
 
 
 def parse_args():
@@ -49,99 +62,189 @@ def parse_args():
         default=None,
         help="Path to output CSV file (optional, prints to stdout if not specified)"
     )
+    parser.add_argument(
+        "--threads", "-t",
+        type=int,
+        default=None,
+        help="Number of worker processes for reading FASTA files (default: all CPUs)"
+    )
     return parser.parse_args()
 
 
-def get_genome_length_from_fasta(fasta_path):
-    """Read a FASTA file and return total sequence length."""
+def count_sequence_length(f):
+    """
+    Read an open binary FASTA file in large blocks and return total sequence length.
+    Sequence length is the block size minus line endings and header lines.
+    """
     length = 0
-    with open(fasta_path, 'r') as f:
-        for line in f:
-            if not line.startswith('>'):
-                length += len(line.strip())
+    in_header = False  # Block starts in the middle of a header line
+    prev_byte = b'\n'
+    while True:
+        block = f.read(READ_BLOCK_SIZE)
+        if not block:
+            break
+
+        # Count bytes of header lines (excluding the '\n', counted below)
+        header_bytes = 0
+        pos = 0
+        if in_header:
+            end = block.find(b'\n')
+            if end == -1:
+                end = len(block)
+            else:
+                in_header = False
+            header_bytes += end - block.count(b'\r', 0, end)
+            pos = end
+        while not in_header:
+            if pos == 0 and prev_byte == b'\n' and block.startswith(b'>'):
+                start = 0
+            else:
+                start = block.find(b'\n>', pos)
+                if start == -1:
+                    break
+                start += 1
+            end = block.find(b'\n', start)
+            if end == -1:
+                end = len(block)
+                in_header = True
+            header_bytes += end - start - block.count(b'\r', start, end)
+            pos = end
+
+        length += len(block) - header_bytes - block.count(b'\n') - block.count(b'\r')
+        prev_byte = block[-1:]
     return length
 
 
-def get_genome_id_from_fasta(fasta_path):
-    """Extract genome ID from FASTA header."""
-    with open(fasta_path, 'r') as f:
+def scan_fasta(fasta_path):
+    """
+    Return (genome_id, sequence_length) for a FASTA file in a single open.
+    Genome ID is the first word of the first header; None if there is no header.
+    """
+    with open(fasta_path, 'rb') as f:
         for line in f:
-            if line.startswith('>'):
-                # Extract ID (first word after >)
-                header = line[1:].strip()
-                genome_id = header.split()[0]
-                return genome_id
-    return None
+            if line.startswith(b'>'):
+                genome_id = line[1:].split()[0].decode()
+                break
+        else:
+            return None, 0
+        f.seek(0)
+        return genome_id, count_sequence_length(f)
 
 
-def load_genome_lengths(fasta_dir):
+def load_genome_lengths(fasta_dir, workers=None):
     """Load genome lengths from all FASTA files in directory."""
     genome_lengths = {}
     fasta_extensions = ['.fasta', '.fa', '.fna', '.fsa']
 
     fasta_path = Path(fasta_dir)
-    for ext in fasta_extensions:
-        for fasta_file in fasta_path.glob(f'*{ext}'):
-            genome_id = get_genome_id_from_fasta(fasta_file)
+    fasta_files = [f for ext in fasta_extensions for f in fasta_path.glob(f'*{ext}')]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for genome_id, length in executor.map(scan_fasta, fasta_files, chunksize=8):
             if genome_id:
                 normalized_id = normalize_genome_id(genome_id)
-                length = get_genome_length_from_fasta(fasta_file)
                 genome_lengths[normalized_id] = length
                 print(f"Loaded genome {genome_id} -> {normalized_id}: {length:,} bp")
 
     return genome_lengths
 
 
+def group_regions(genome_ids, starts, ends):
+    """
+    Group parallel arrays of genome IDs and region coordinates into
+    {genome_id: int64 array of shape (n_regions, 2)} with (start, end) rows,
+    preserving input order within a genome.
+    """
+    codes, uniques = pd.factorize(genome_ids)
+    order = np.argsort(codes, kind='stable')
+    regions = np.column_stack([starts[order], ends[order]]).astype(np.int64, copy=False)
+    bounds = np.concatenate([[0], np.bincount(codes, minlength=len(uniques)).cumsum()]).tolist()
+
+    return {
+        genome_id: regions[bounds[i]:bounds[i + 1]]
+        for i, genome_id in enumerate(uniques)
+    }
+
+
 def load_ground_truth(csv_path):
     """Load ground truth prophage regions from CSV."""
-    regions = defaultdict(list)
-
-    with open(csv_path, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            genome_id = normalize_genome_id(row['NCBI Id'].strip())
-            start = int(row['start'])
-            end = int(row['end'])
-            regions[genome_id].append((start, end))
+    df = pd.read_csv(
+        csv_path,
+        usecols=['NCBI Id', 'start', 'end'],
+        dtype={'NCBI Id': str, 'start': 'int64', 'end': 'int64'},
+        keep_default_na=False,
+    )
+    genome_ids = df['NCBI Id'].str.strip().map(normalize_genome_id)
 
-    return regions
+    return group_regions(genome_ids.to_numpy(), df['start'].to_numpy(), df['end'].to_numpy())
 
 
-def load_predictions(csv_path):
-    """Load predicted prophage regions from CSV."""
-    regions = defaultdict(list)
+def reparse_prediction_lines(csv_path, line_nums):
+    """
+    Re-read the given prediction line numbers with csv.reader and int().
+    Returns (recovered, errors): rows int() accepts as (genome_id, start, end),
+    and (line_num, row, error_msg) for rows it rejects.
+    """
+    recovered = []
     errors = []
-
     with open(csv_path, 'r') as f:
         reader = csv.reader(f)
-        header = next(reader)  # Skip header
-        line_num = 1
-        for row in reader:
-            line_num += 1
+        next(reader)  # Skip header
+        for line_num, row in enumerate(reader, start=2):
+            if line_num not in line_nums:
+                continue
             if len(row) < 3:
                 error_msg = f"Line {line_num}: Fewer than 3 columns"
                 errors.append((line_num, row, error_msg))
                 continue
-            # Read by position: Contig=0, Start=1, End=2
-            genome_id = normalize_genome_id(row[0].strip())
             try:
-                start = int(row[1])
-                end = int(row[2])
-                regions[genome_id].append((start, end))
+                recovered.append((row[0].strip(), int(row[1]), int(row[2])))
             except ValueError as e:
                 error_msg = f"Line {line_num}: {e}"
                 errors.append((line_num, row, error_msg))
+    return recovered, errors
 
-    return regions, errors
 
-
-def regions_to_positions(regions):
-    """Convert list of (start, end) regions to set of positions."""
-    positions = set()
-    for start, end in regions:
-        # Include both start and end positions (1-based coordinates)
-        positions.update(range(start, end + 1))
-    return positions
+def load_predictions(csv_path):
+    """Load predicted prophage regions from CSV."""
+    # Read by position: Contig=0, Start=1, End=2 (extra columns ignored)
+    try:
+        df = pd.read_csv(
+            csv_path,
+            header=None,
+            skiprows=1,
+            names=[0, 1, 2],
+            usecols=[0, 1, 2],
+            dtype=str,
+            keep_default_na=False,
+            skip_blank_lines=False,
+        )
+    except pd.errors.EmptyDataError:
+        return {}, []
+
+    starts = df[1].str.strip()
+    ends = df[2].str.strip()
+    valid = (starts.str.fullmatch(INTEGER_PATTERN) & ends.str.fullmatch(INTEGER_PATTERN)).to_numpy()
+
+    genome_ids = df[0][valid].str.strip()
+    starts = starts[valid].astype('int64').to_numpy()
+    ends = ends[valid].astype('int64').to_numpy()
+
+    # Rows failing the fast check are re-read individually for exact int()
+    # semantics and error messages; data rows start at line 2
+    errors = []
+    if not valid.all():
+        bad_lines = set((np.flatnonzero(~valid) + 2).tolist())
+        recovered, errors = reparse_prediction_lines(csv_path, bad_lines)
+        if recovered:
+            extra_ids, extra_starts, extra_ends = zip(*recovered)
+            genome_ids = pd.concat([genome_ids, pd.Series(extra_ids)], ignore_index=True)
+            starts = np.concatenate([starts, np.array(extra_starts, dtype=np.int64)])
+            ends = np.concatenate([ends, np.array(extra_ends, dtype=np.int64)])
+
+    genome_ids = genome_ids.map(normalize_genome_id)
+    regions = group_regions(genome_ids.to_numpy(), starts, ends)
+    return regions, errors
 
 
 def calculate_metrics(tp, tn, fp, fn):
@@ -180,16 +283,51 @@ def calculate_metrics(tp, tn, fp, fn):
 
 def calculate_genome_metrics(true_regions, pred_regions, genome_length):
     """Calculate nucleotide-level metrics for a single genome."""
-    true_positions = regions_to_positions(true_regions)
-    pred_positions = regions_to_positions(pred_regions)
-
-    all_positions = set(range(1, genome_length + 1))
+    true_regions = np.asarray(true_regions, dtype=np.int64).reshape(-1, 2)
+    pred_regions = np.asarray(pred_regions, dtype=np.int64).reshape(-1, 2)
+    # A region with end < start covers no positions; left in, it would add
+    # negative depth that cancels real coverage
+    true_regions = true_regions[true_regions[:, 1] >= true_regions[:, 0]]
+    pred_regions = pred_regions[pred_regions[:, 1] >= pred_regions[:, 0]]
+    n_true = len(true_regions)
+    n_pred = len(pred_regions)
+
+    # Difference-array sweep over one preallocated breakpoint array:
+    # [true starts | true ends + 1 | pred starts | pred ends + 1]
+    # 1-based inclusive regions add coverage at start and remove it at end + 1
+    n_events = 2 * (n_true + n_pred)
+    positions = np.empty(n_events, dtype=np.int64)
+    positions[:n_true] = true_regions[:, 0]
+    positions[n_true:2 * n_true] = true_regions[:, 1] + 1
+    positions[2 * n_true:2 * n_true + n_pred] = pred_regions[:, 0]
+    positions[2 * n_true + n_pred:] = pred_regions[:, 1] + 1
+
+    true_delta = np.zeros(n_events, dtype=np.int64)
+    true_delta[:n_true] = 1
+    true_delta[n_true:2 * n_true] = -1
+    pred_delta = np.zeros(n_events, dtype=np.int64)
+    pred_delta[2 * n_true:2 * n_true + n_pred] = 1
+    pred_delta[2 * n_true + n_pred:] = -1
+
+    order = np.argsort(positions, kind='stable')
+    positions = positions[order]
+    true_depth = true_delta[order].cumsum()[:-1]
+    pred_depth = pred_delta[order].cumsum()[:-1]
+
+    # Coverage between consecutive breakpoints is constant; classify each
+    # segment as 0=neither, 1=pred only, 2=true only, 3=both
+    seg_class = (true_depth > 0) * 2 + (pred_depth > 0)
+    seg_len = np.bincount(seg_class, weights=np.diff(positions), minlength=4)
+    genome_seg_len = np.bincount(
+        seg_class, weights=np.diff(np.clip(positions, 1, genome_length + 1)), minlength=4
+    )
 
     # Calculate confusion matrix at nucleotide level
-    tp = len(true_positions & pred_positions)  # In both
-    fp = len(pred_positions - true_positions)  # Predicted but not true
-    fn = len(true_positions - pred_positions)  # True but not predicted
-    tn = len(all_positions - true_positions - pred_positions)  # Neither
+    tp = int(seg_len[3])  # In both
+    fp = int(seg_len[1])  # Predicted but not true
+    fn = int(seg_len[2])  # True but not predicted
+    # Neither: genome positions (1..genome_length) covered by neither set
+    tn = genome_length - int(genome_seg_len[1:].sum())
 
     return calculate_metrics(tp, tn, fp, fn)
 
@@ -198,7 +336,7 @@ def main():
     args = parse_args()
 
     print("Loading genome lengths from FASTA files...")
-    genome_lengths = load_genome_lengths(args.fasta_dir)
+    genome_lengths = load_genome_lengths(args.fasta_dir, args.threads)
     print(f"Loaded {len(genome_lengths)} genomes\n")
 
     print("Loading ground truth...")
@@ -258,19 +396,26 @@ def main():
         print("AVERAGE METRICS ACROSS ALL GENOMES:")
         print("-" * 80)
 
-        avg_metrics = {}
+        # One structured array of per-genome values for column reductions
+        count_names = ['Genome_Length', 'True_Regions', 'Pred_Regions', 'TP', 'TN', 'FP', 'FN']
         metric_names = ['Accuracy', 'Precision', 'Recall', 'F1', 'MCC']
+        columns = count_names + metric_names
+        result_array = np.array(
+            [tuple(r[c] for c in columns) for r in results],
+            dtype=[(c, np.int64) for c in count_names] + [(m, np.float64) for m in metric_names],
+        )
 
+        avg_metrics = {}
         for metric in metric_names:
-            values = [r[metric] for r in results]
-            avg_metrics[metric] = sum(values) / len(values)
+            avg_metrics[metric] = float(result_array[metric].mean())
             print(f"  {metric}: {avg_metrics[metric]:.4f}")
 
         # Also calculate total TP, TN, FP, FN
-        total_tp = sum(r['TP'] for r in results)
-        total_tn = sum(r['TN'] for r in results)
-        total_fp = sum(r['FP'] for r in results)
-        total_fn = sum(r['FN'] for r in results)
+        totals = {c: int(result_array[c].sum()) for c in count_names}
+        total_tp = totals['TP']
+        total_tn = totals['TN']
+        total_fp = totals['FP']
+        total_fn = totals['FN']
 
         print()
         print("AGGREGATE METRICS (summed across all genomes):")
@@ -290,48 +435,46 @@ def main():
 
     # Write results to CSV if output specified
     if args.output:
-        with open(args.output, 'w', newline='') as f:
-            fieldnames = ['Genome', 'Genome_Length', 'True_Regions', 'Pred_Regions',
-                          'TP', 'TN', 'FP', 'FN', 'Accuracy', 'Precision', 'Recall', 'F1', 'MCC']
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(results)
-
-            # Write average row
-            avg_row = {
-                'Genome': 'AVERAGE',
-                'Genome_Length': '',
-                'True_Regions': '',
-                'Pred_Regions': '',
-                'TP': '',
-                'TN': '',
-                'FP': '',
-                'FN': '',
-                'Accuracy': avg_metrics['Accuracy'],
-                'Precision': avg_metrics['Precision'],
-                'Recall': avg_metrics['Recall'],
-                'F1': avg_metrics['F1'],
-                'MCC': avg_metrics['MCC']
-            }
-            writer.writerow(avg_row)
-
-            # Write aggregate row
-            agg_row = {
-                'Genome': 'AGGREGATE',
-                'Genome_Length': sum(genome_lengths.get(g, 0) for g in valid_genomes),
-                'True_Regions': sum(r['True_Regions'] for r in results),
-                'Pred_Regions': sum(r['Pred_Regions'] for r in results),
-                'TP': total_tp,
-                'TN': total_tn,
-                'FP': total_fp,
-                'FN': total_fn,
-                'Accuracy': agg_metrics['Accuracy'],
-                'Precision': agg_metrics['Precision'],
-                'Recall': agg_metrics['Recall'],
-                'F1': agg_metrics['F1'],
-                'MCC': agg_metrics['MCC']
-            }
-            writer.writerow(agg_row)
+        fieldnames = ['Genome', 'Genome_Length', 'True_Regions', 'Pred_Regions',
+                      'TP', 'TN', 'FP', 'FN', 'Accuracy', 'Precision', 'Recall', 'F1', 'MCC']
+
+        # Average row
+        avg_row = {
+            'Genome': 'AVERAGE',
+            'Genome_Length': '',
+            'True_Regions': '',
+            'Pred_Regions': '',
+            'TP': '',
+            'TN': '',
+            'FP': '',
+            'FN': '',
+            'Accuracy': avg_metrics['Accuracy'],
+            'Precision': avg_metrics['Precision'],
+            'Recall': avg_metrics['Recall'],
+            'F1': avg_metrics['F1'],
+            'MCC': avg_metrics['MCC']
+        }
+
+        # Aggregate row
+        agg_row = {
+            'Genome': 'AGGREGATE',
+            'Genome_Length': totals['Genome_Length'],
+            'True_Regions': totals['True_Regions'],
+            'Pred_Regions': totals['Pred_Regions'],
+            'TP': total_tp,
+            'TN': total_tn,
+            'FP': total_fp,
+            'FN': total_fn,
+            'Accuracy': agg_metrics['Accuracy'],
+            'Precision': agg_metrics['Precision'],
+            'Recall': agg_metrics['Recall'],
+            'F1': agg_metrics['F1'],
+            'MCC': agg_metrics['MCC']
+        }
+
+        # Object dtype keeps each value's own formatting (e.g. 0 vs 0.0)
+        results_df = pd.DataFrame(results + [avg_row, agg_row], columns=fieldnames, dtype=object)
+        results_df.to_csv(args.output, index=False)
 
         print(f"\nResults written to: {args.output}")
 
@@ -7,9 +7,14 @@ Output: Cluster membership file mapping each genome to a cluster ID
 """
 
 import argparse
+import csv
 import sys
+from array import array
 from collections import defaultdict
 
+import numpy as np
+import pandas as pd
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -39,20 +44,55 @@ def parse_args():
     return parser.parse_args()
 
 
+FASTA_EXTENSIONS = ('.fa', '.fasta', '.fna')
+
+# Number of MASH distance rows parsed per chunk
+CHUNK_SIZE = 2_000_000
+
+
+def genome_name(path):
+    """Extract genome name from a MASH sequence path (remove path and extension)."""
+    name = path.strip().rsplit('/', 1)[-1]
+    for ext in FASTA_EXTENSIONS:
+        if name.endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+
 class UnionFind:
-    """Union-Find data structure for efficient clustering."""
+    """
+    Union-Find data structure for efficient clustering.
+
+    Genome names are interned to contiguous integer IDs; parent and rank
+    are stored in compact typed arrays indexed by those IDs.
+    """
 
     def __init__(self):
-        self.parent = {}
-        self.rank = {}
+        self.name_to_id = {}
+        self.names = []
+        self.parent = array('i')
+        self.rank = array('B')
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_id(self, name):
+        """Return the integer ID for a genome name, adding it if new."""
+        i = self.name_to_id.get(name)
+        if i is None:
+            i = len(self.names)
+            self.name_to_id[name] = i
+            self.names.append(name)
+            self.parent.append(i)
+            self.rank.append(0)
+        return i
 
     def find(self, x):
-        if x not in self.parent:
-            self.parent[x] = x
-            self.rank[x] = 0
-        if self.parent[x] != x:
-            self.parent[x] = self.find(self.parent[x])  # Path compression
-        return self.parent[x]
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]  # Path halving
+            x = parent[x]
+        return x
 
     def union(self, x, y):
         px, py = self.find(x), self.find(y)
@@ -66,10 +106,11 @@ class UnionFind:
             self.rank[px] += 1
 
     def get_clusters(self):
-        """Return dict mapping cluster_id -> list of members."""
+        """Return dict mapping representative name -> list of member names."""
         clusters = defaultdict(list)
-        for x in self.parent:
-            clusters[self.find(x)].append(x)
+        names = self.names
+        for i, name in enumerate(names):
+            clusters[names[self.find(i)]].append(name)
         return clusters
 
 
@@ -83,72 +124,50 @@ def main():
     print()
 
     uf = UnionFind()
-    genomes = set()
     edges_below_threshold = 0
     total_edges = 0
 
     print("Reading MASH distances and clustering...")
 
-    # Read the tabular MASH output
+    # Read the tabular MASH output in chunks with the C parser
     # Format: query\treference\tdistance\tp-value\tshared-hashes
-    with open(args.input, 'r') as f:
-        # Skip header line if present
-        first_line = f.readline().strip()
-        if not first_line.startswith('#'):
-            # First line is data, process it
-            parts = first_line.split('\t')
-            if len(parts) >= 3:
-                try:
-                    genome1 = parts[0].split('/')[-1].replace('.fa', '').replace('.fasta', '').replace('.fna', '')
-                    genome2 = parts[1].split('/')[-1].replace('.fa', '').replace('.fasta', '').replace('.fna', '')
-                    distance = float(parts[2])
-
-                    genomes.add(genome1)
-                    genomes.add(genome2)
-                    uf.find(genome1)  # Initialize in union-find
-                    uf.find(genome2)
-
-                    if genome1 != genome2 and distance <= args.threshold:
-                        uf.union(genome1, genome2)
-                        edges_below_threshold += 1
-                    total_edges += 1
-                except (ValueError, IndexError):
-                    pass
-
-        # Process rest of file
-        for line_num, line in enumerate(f, start=2):
-            if line_num % 1000000 == 0:
-                print(f"  Processed {line_num:,} lines...")
-
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-
-            parts = line.split('\t')
-            if len(parts) < 3:
-                continue
-
-            try:
-                # Extract genome names (remove path and extension)
-                genome1 = parts[0].split('/')[-1].replace('.fa', '').replace('.fasta', '').replace('.fna', '')
-                genome2 = parts[1].split('/')[-1].replace('.fa', '').replace('.fasta', '').replace('.fna', '')
-                distance = float(parts[2])
-
-                genomes.add(genome1)
-                genomes.add(genome2)
-                uf.find(genome1)  # Initialize in union-find
-                uf.find(genome2)
-
-                if genome1 != genome2 and distance <= args.threshold:
-                    uf.union(genome1, genome2)
-                    edges_below_threshold += 1
-                total_edges += 1
-
-            except (ValueError, IndexError) as e:
-                continue
+    # Header lines (starting with '#') are dropped below; comment='#' would
+    # also cut genome paths that contain '#'
+    reader = pd.read_csv(
+        args.input,
+        sep='\t',
+        header=None,
+        usecols=[0, 1, 2],
+        dtype={0: str, 1: str, 2: str},
+        quoting=csv.QUOTE_NONE,
+        chunksize=CHUNK_SIZE,
+    )
+    lines_read = 0
+    for chunk in reader:
+        lines_read += len(chunk)
+        distance = pd.to_numeric(chunk[2], errors='coerce')
+        header = chunk[0].str.lstrip().str.startswith('#', na=False)
+        valid = distance.notna() & chunk[0].notna() & chunk[1].notna() & ~header
+        chunk = chunk[valid]
+        distance = distance[valid].to_numpy()
+
+        # Intern each distinct path once; interleave query/reference so
+        # genomes are registered in the order they appear in the file
+        pairs = np.column_stack([chunk[0].to_numpy(), chunk[1].to_numpy()]).ravel()
+        codes, uniques = pd.factorize(pairs)
+        unique_ids = np.array([uf.get_id(genome_name(u)) for u in uniques], dtype=np.int64)
+        ids = unique_ids[codes].reshape(-1, 2)
+
+        linked = (ids[:, 0] != ids[:, 1]) & (distance <= args.threshold)
+        for id1, id2 in ids[linked].tolist():
+            uf.union(id1, id2)
+        edges_below_threshold += int(linked.sum())
+        total_edges += len(chunk)
+
+        print(f"  Processed {lines_read:,} lines...")
 
     print(f"\nClustering complete:")
-    print(f"  Total genomes: {len(genomes):,}")
+    print(f"  Total genomes: {len(uf):,}")
     print(f"  Total pairwise comparisons: {total_edges:,}")
     print(f"  Pairs below threshold: {edges_below_threshold:,}")
 
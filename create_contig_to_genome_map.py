@@ -9,12 +9,26 @@ Output: TSV file with columns: contig_id, genome_accession
 """
 
 import argparse
+import functools
 import gzip
+import shutil
+import subprocess
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor
 import sys
 
 
+# Decompress with pigz and filter headers with grep when both are installed,
+# so sequence bytes never reach Python; otherwise fall back to Python gzip
+USE_PIGZ = shutil.which('pigz') is not None and shutil.which('grep') is not None
+
+# Output buffer for the contig mapping file
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Alternate accession prefix to try when a genome file is not found
+ALT_PREFIX = {'GCA_': 'GCF_', 'GCF_': 'GCA_'}
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Create contig ID to genome accession mapping"
@@ -38,7 +52,7 @@ def parse_args():
         "--threads", "-t",
         type=int,
         default=16,
-        help="Number of parallel threads (default: 16)"
+        help="Number of parallel worker processes (default: 16)"
     )
     return parser.parse_args()
 
@@ -52,6 +66,12 @@ def normalize_accession(accession):
     return accession
 
 
+@functools.lru_cache(maxsize=4)
+def database_dir(gtdb_dir):
+    """Return the GTDB database directory (built once per gtdb_dir)."""
+    return Path(gtdb_dir) / "database"
+
+
 def accession_to_path(gtdb_dir, accession):
     """Convert accession to file path."""
     accession = normalize_accession(accession)
@@ -61,19 +81,31 @@ def accession_to_path(gtdb_dir, accession):
         return None, None
 
     prefix = parts[0]  # GCA or GCF
-    number_version = parts[1]
-    number = number_version.split('.')[0]
 
-    # Pad to 9 digits and split into chunks
-    number = number.zfill(9)
-    chunk1 = number[0:3]
-    chunk2 = number[3:6]
-    chunk3 = number[6:9]
+    # Pad to 9 digits and split into 3-digit chunks
+    number = parts[1].split('.', 1)[0].zfill(9)
 
-    fna_path = Path(gtdb_dir) / "database" / prefix / chunk1 / chunk2 / chunk3 / f"{accession}_genomic.fna.gz"
+    fna_path = database_dir(gtdb_dir) / prefix / number[0:3] / number[3:6] / number[6:9] / f"{accession}_genomic.fna.gz"
     return fna_path, accession
 
 
+def read_header_lines(fna_path):
+    """Return the '>' header lines (bytes) of a gzipped FASTA file."""
+    if USE_PIGZ:
+        pigz = subprocess.Popen(["pigz", "-dc", str(fna_path)], stdout=subprocess.PIPE)
+        grep = subprocess.Popen(["grep", "^>"], stdin=pigz.stdout, stdout=subprocess.PIPE)
+        pigz.stdout.close()  # Let pigz receive SIGPIPE if grep exits early
+        output, _ = grep.communicate()
+        # grep exits 1 when there are no matching lines
+        if pigz.wait() != 0 or grep.returncode > 1:
+            raise RuntimeError(f"pigz -dc failed for {fna_path}")
+        return output.splitlines()
+
+    # Binary mode: only header lines are decoded, sequence lines are skipped as bytes
+    with gzip.open(fna_path, 'rb') as f:
+        return [line for line in f if line.startswith(b'>')]
+
+
 def extract_contig_ids(args_tuple):
     """Extract contig IDs from a genome file."""
     accession, gtdb_dir = args_tuple
@@ -81,13 +113,11 @@ def extract_contig_ids(args_tuple):
     fna_path, normalized_acc = accession_to_path(gtdb_dir, accession)
 
     if fna_path is None or not fna_path.exists():
-        # Try alternate prefix
-        if normalized_acc and normalized_acc.startswith('GCA_'):
-            alt_acc = normalized_acc.replace('GCA_', 'GCF_')
-        elif normalized_acc and normalized_acc.startswith('GCF_'):
-            alt_acc = normalized_acc.replace('GCF_', 'GCA_')
-        else:
+        # Try alternate prefix (GenBank <-> RefSeq)
+        alt_prefix = ALT_PREFIX.get(normalized_acc[:4]) if normalized_acc else None
+        if alt_prefix is None:
             return (accession, [], 'invalid')
+        alt_acc = alt_prefix + normalized_acc[4:]
 
         fna_path, normalized_acc = accession_to_path(gtdb_dir, alt_acc)
         if fna_path is None or not fna_path.exists():
@@ -95,13 +125,10 @@ def extract_contig_ids(args_tuple):
 
     contig_ids = []
     try:
-        with gzip.open(fna_path, 'rt') as f:
-            for line in f:
-                if line.startswith('>'):
-                    # Extract sequence ID (first word after >)
-                    header = line[1:].strip()
-                    seq_id = header.split()[0]
-                    contig_ids.append(seq_id)
+        for line in read_header_lines(fna_path):
+            # Extract sequence ID (first word after >)
+            seq_id = line[1:].split(None, 1)[0].decode()
+            contig_ids.append(seq_id)
         return (normalized_acc, contig_ids, 'success')
     except Exception as e:
         return (accession, [], f'error: {e}')
@@ -112,7 +139,7 @@ def main():
 
     # Load accession list
     with open(args.accession_list, 'r') as f:
-        accessions = [line.strip() for line in f if line.strip()]
+        accessions = [acc for acc in map(str.strip, f) if acc]
 
     print(f"Creating contig ID to genome accession mapping")
     print(f"=" * 50)
@@ -125,52 +152,42 @@ def main():
     # Process genomes in parallel
     task_args = [(acc, args.gtdb_dir) for acc in accessions]
 
-    all_mappings = []
     stats = {'success': 0, 'not_found': 0, 'error': 0}
+    total_mappings = 0
 
     print(f"Processing {len(accessions)} genomes...")
+    print(f"Writing mappings to {args.output}")
 
-    with ThreadPoolExecutor(max_workers=args.threads) as executor:
-        futures = {executor.submit(extract_contig_ids, task): task[0] for task in task_args}
+    # Header scanning holds the GIL, so use processes rather than threads;
+    # mappings are written as each genome completes instead of held in memory
+    with open(args.output, 'w', buffering=WRITE_BUFFER_SIZE) as out, \
+            ProcessPoolExecutor(max_workers=args.threads) as executor:
+        out.write("contig_id\tgenome_accession\n")
+        results = executor.map(extract_contig_ids, task_args, chunksize=32)
 
         completed = 0
-        for future in as_completed(futures):
+        for accession, contig_ids, status in results:
             completed += 1
 
             if completed % 1000 == 0:
                 print(f"  Progress: {completed}/{len(accessions)}")
 
-            try:
-                accession, contig_ids, status = future.result()
-
-                if status == 'success':
-                    stats['success'] += 1
-                    for contig_id in contig_ids:
-                        all_mappings.append((contig_id, accession))
-                elif status == 'not_found':
-                    stats['not_found'] += 1
-                else:
-                    stats['error'] += 1
-
-            except Exception as e:
+            if status == 'success':
+                stats['success'] += 1
+                out.writelines(f"{contig_id}\t{accession}\n" for contig_id in contig_ids)
+                total_mappings += len(contig_ids)
+            elif status == 'not_found':
+                stats['not_found'] += 1
+            else:
                 stats['error'] += 1
-                print(f"  Error: {e}")
-
-    # Write output
-    print(f"\nWriting {len(all_mappings)} mappings to {args.output}")
-
-    with open(args.output, 'w') as f:
-        f.write("contig_id\tgenome_accession\n")
-        for contig_id, accession in all_mappings:
-            f.write(f"{contig_id}\t{accession}\n")
 
     # Summary
     print(f"\nSummary:")
     print(f"  Genomes processed: {stats['success']}")
     print(f"  Genomes not found: {stats['not_found']}")
     print(f"  Errors: {stats['error']}")
-    print(f"  Total contig mappings: {len(all_mappings)}")
-    print(f"  Average contigs per genome: {len(all_mappings) / max(stats['success'], 1):.1f}")
+    print(f"  Total contig mappings: {total_mappings}")
+    print(f"  Average contigs per genome: {total_mappings / max(stats['success'], 1):.1f}")
 
 
 if __name__ == "__main__":
@@ -20,8 +20,15 @@ Usage:
 
 import argparse
 import csv
+from collections import Counter
 from pathlib import Path
 
+from Bio.SeqIO.FastaIO import SimpleFastaParser
+
+# Read/write buffers for the (potentially multi-GB) FASTA and CSV
+READ_BUFFER_SIZE = 1 << 20
+WRITE_BUFFER_SIZE = 1 << 20
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -58,28 +65,11 @@ def parse_args():
 
 
 def read_fasta(fasta_file):
-    """Read FASTA file and return dict of {id: sequence}."""
-    sequences = {}
-    current_id = None
-    current_seq = []
-
-    with open(fasta_file, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if line.startswith('>'):
-                if current_id is not None:
-                    sequences[current_id] = ''.join(current_seq)
-                # Extract ID (first word after >)
-                current_id = line[1:].split()[0]
-                current_seq = []
-            else:
-                current_seq.append(line)
-
-        # Don't forget last sequence
-        if current_id is not None:
-            sequences[current_id] = ''.join(current_seq)
-
-    return sequences
+    """Stream FASTA file, yielding (id, sequence) one record at a time."""
+    with open(fasta_file, 'r', buffering=READ_BUFFER_SIZE) as f:
+        for title, sequence in SimpleFastaParser(f):
+            # Extract ID (first word of the header)
+            yield title.split(None, 1)[0], sequence
 
 
 def read_labels(labels_file):
@@ -101,6 +91,34 @@ def read_labels(labels_file):
     return labels
 
 
+def training_rows(fasta_file, labels, label_map, counts, seen_ids):
+    """
+    Yield CSV rows (segment_id, sequence, numeric_label, source) in FASTA order.
+    Tallies written labels and unlabeled sequences in counts, and records
+    every sequence ID read in seen_ids. A repeated ID is written once, from
+    its first record.
+    """
+    for segment_id, sequence in read_fasta(fasta_file):
+        if segment_id in seen_ids:
+            continue
+        seen_ids.add(segment_id)
+
+        label_source = labels.get(segment_id)
+        if label_source is None:
+            counts['missing_label'] += 1
+            continue
+
+        text_label, source = label_source
+        numeric_label = label_map.get(text_label)
+
+        if numeric_label is None:
+            print(f"  Warning: Unknown label '{text_label}' for {segment_id}")
+            continue
+
+        counts[text_label] += 1
+        yield segment_id, sequence, numeric_label, source
+
+
 def main():
     args = parse_args()
 
@@ -110,11 +128,6 @@ def main():
     print(f"  Output: {args.output}")
     print()
 
-    # Read sequences
-    print("Reading sequences...")
-    sequences = read_fasta(args.fasta)
-    print(f"  Loaded {len(sequences):,} sequences")
-
     # Read labels
     print("Reading labels...")
     labels = read_labels(args.labels)
@@ -130,42 +143,25 @@ def main():
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # Write CSV
-    print(f"Writing CSV to {args.output}...")
+    # Stream sequences straight into the CSV
+    print(f"Streaming sequences from {args.fasta} to {args.output}...")
 
-    phage_count = 0
-    bacteria_count = 0
-    missing_seq = 0
-    missing_label = 0
+    counts = Counter()
+    seen_ids = set()
 
-    with open(args.output, 'w', newline='') as f:
+    with open(args.output, 'w', newline='', buffering=WRITE_BUFFER_SIZE) as f:
         writer = csv.writer(f)
         writer.writerow(['segment_id', 'sequence', 'label', 'source'])
+        writer.writerows(training_rows(args.fasta, labels, label_map, counts, seen_ids))
 
-        # Use labels as the source of truth for order
-        for segment_id, (text_label, source) in labels.items():
-            if segment_id not in sequences:
-                missing_seq += 1
-                continue
-
-            sequence = sequences[segment_id]
-            numeric_label = label_map.get(text_label)
-
-            if numeric_label is None:
-                print(f"  Warning: Unknown label '{text_label}' for {segment_id}")
-                continue
-
-            writer.writerow([segment_id, sequence, numeric_label, source])
+    phage_count = counts['phage']
+    bacteria_count = counts['bacteria']
+    missing_label = counts['missing_label']
 
-            if text_label == 'phage':
-                phage_count += 1
-            else:
-                bacteria_count += 1
+    print(f"  Read {len(seen_ids):,} sequences")
 
-    # Check for sequences without labels
-    for seq_id in sequences:
-        if seq_id not in labels:
-            missing_label += 1
+    # Check for labels without sequences
+    missing_seq = sum(1 for segment_id in labels if segment_id not in seen_ids)
 
     print()
     print("Summary:")
@@ -8,18 +8,36 @@ Data hosted at: https://millardlab-inphared.s3.climb.ac.uk/
 
 import argparse
 import os
-import gzip
-import shutil
+import http.client
+import json
+import ssl
 import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
 from datetime import datetime
-import urllib.request
 import urllib.error
+import urllib.parse
+import zlib
 
 
 # S3 bucket base URL
 S3_BASE_URL = "https://millardlab-inphared.s3.climb.ac.uk/"
 
+# Concurrent HEAD requests when searching for the latest dataset date
+PROBE_THREADS = 16
+
+# Cached result of the latest-date search, reused for DATE_CACHE_TTL seconds
+DATE_CACHE_PATH = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "inphared" / "latest_date.json"
+DATE_CACHE_TTL = 6 * 60 * 60
+
+# Files larger than this are fetched as parallel byte ranges of this size
+RANGE_CHUNK_SIZE = 64 * 1024 * 1024
+RANGE_THREADS = 4
+
 # All available file suffixes (without date prefix)
 FILE_SUFFIXES = [
     # Core data files
@@ -162,6 +180,17 @@ Categories available: core, metadata, genomes, databases, itol, vcontact2, genba
         action="store_true",
         help="Use curl instead of Python urllib (may be faster for large files)"
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Ignore the cached latest dataset date and search again"
+    )
+    parser.add_argument(
+        "--threads", "-t",
+        type=int,
+        default=8,
+        help="Number of files to download concurrently (default: 8; use 1 on slow links)"
+    )
     parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -170,18 +199,142 @@ Categories available: core, metadata, genomes, databases, itol, vcontact2, genba
     return parser.parse_args()
 
 
+# Per-thread keep-alive connections, keyed by (scheme, host)
+_connections = threading.local()
+
+# Redirect status codes followed by open_url
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+def get_connection(scheme, netloc, timeout):
+    """Return this thread's persistent HTTP(S) connection to a host."""
+    pool = getattr(_connections, 'pool', None)
+    if pool is None:
+        pool = _connections.pool = {}
+    conn = pool.get((scheme, netloc))
+    if conn is None:
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(netloc, timeout=timeout, context=ssl.create_default_context())
+        else:
+            conn = http.client.HTTPConnection(netloc, timeout=timeout)
+        pool[(scheme, netloc)] = conn
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+    return conn
+
+
+def drop_connection(scheme, netloc):
+    """Close and forget this thread's connection to a host."""
+    conn = getattr(_connections, 'pool', {}).pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+
+
+@contextmanager
+def open_url(url, method='GET', headers=None, timeout=60):
+    """
+    Send a request over a kept-alive connection and yield the response.
+
+    Connections are reused across requests from the same thread, so TCP/TLS
+    handshakes are paid once per host rather than once per file. Redirects
+    are followed; HTTP errors and connection failures raise
+    urllib.error.HTTPError / urllib.error.URLError like urllib.request.urlopen.
+    """
+    for _ in range(len(REDIRECT_CODES) + 1):
+        parts = urllib.parse.urlsplit(url)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+
+        # A reused connection may have been closed by the server; retry once fresh
+        for attempt in range(2):
+            conn = get_connection(parts.scheme, parts.netloc, timeout)
+            try:
+                conn.request(method, target, headers=headers or {})
+                response = conn.getresponse()
+                break
+            except (OSError, http.client.HTTPException) as e:
+                drop_connection(parts.scheme, parts.netloc)
+                if attempt == 1:
+                    raise urllib.error.URLError(e)
+
+        if response.status in REDIRECT_CODES and response.getheader('Location'):
+            response.read()
+            url = urllib.parse.urljoin(url, response.getheader('Location'))
+            continue
+
+        if response.status >= 400:
+            response.read()
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+
+        try:
+            yield response
+        finally:
+            # HEAD and zero-length bodies are never read by the caller; finish
+            # them so the connection can be reused
+            if not response.isclosed() and (method == 'HEAD' or response.length == 0):
+                try:
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    pass
+            # An unfinished body would corrupt the next request on this connection
+            if not response.isclosed():
+                response.close()
+                drop_connection(parts.scheme, parts.netloc)
+        return
+
+    raise urllib.error.URLError(f"Too many redirects: {url}")
+
+
 def check_url_exists(url):
     """Check if a URL exists without downloading the full file."""
     try:
-        request = urllib.request.Request(url, method='HEAD')
-        response = urllib.request.urlopen(request, timeout=10)
-        return response.status == 200
+        with open_url(url, method='HEAD', timeout=10) as response:
+            return response.status == 200
     except (urllib.error.HTTPError, urllib.error.URLError):
         return False
 
 
-def find_latest_date():
-    """Try to find the latest available date by checking common patterns."""
+def read_cached_date():
+    """Return the cached latest date if it is younger than DATE_CACHE_TTL, else None."""
+    try:
+        with open(DATE_CACHE_PATH, 'r') as f:
+            cached = json.load(f)
+        if time.time() - cached["fetched"] < DATE_CACHE_TTL:
+            return cached["date"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def write_cached_date(date_str):
+    """Atomically record the latest date found (best effort)."""
+    try:
+        DATE_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = DATE_CACHE_PATH.with_name(f"{DATE_CACHE_PATH.name}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"date": date_str, "fetched": time.time()}, f)
+        os.replace(tmp_path, DATE_CACHE_PATH)
+    except OSError:
+        pass
+
+
+def find_latest_date(output_dir=None, decompress=False, use_cache=True):
+    """
+    Try to find the latest available date by checking common patterns.
+
+    The most likely date is tried with a direct GET of its data.tsv.gz. If
+    output_dir is given and it exists, that response is saved as the
+    download (decompressed if requested) instead of being fetched again.
+    Results are cached in DATE_CACHE_PATH unless use_cache is False.
+    """
+    if use_cache:
+        date_str = read_cached_date()
+        if date_str is not None:
+            print(f"Using cached dataset date: {date_str} ({DATE_CACHE_PATH})")
+            return date_str
+
     # Generate potential dates (current month going back several months)
     now = datetime.now()
     potential_dates = []
@@ -206,31 +359,228 @@ def find_latest_date():
     known_dates = ["14Apr2025", "1Apr2025", "14Mar2025", "1Mar2025", "14Feb2025"]
     potential_dates = known_dates + potential_dates
 
+    # Drop repeats, keeping the first (highest-priority) position
+    potential_dates = list(dict.fromkeys(potential_dates))
+
     print("Searching for latest available dataset...")
-    for date_str in potential_dates:
-        test_url = f"{S3_BASE_URL}{date_str}_data.tsv.gz"
-        if check_url_exists(test_url):
-            print(f"Found dataset: {date_str}")
-            return date_str
+
+    # No HEAD before GET: request the most likely candidate directly
+    date_str = potential_dates[0]
+    filename = f"{date_str}_data.tsv.gz"
+    try:
+        with open_url(f"{S3_BASE_URL}{filename}", headers={'Accept-Encoding': 'identity'}) as response:
+            output_path = None
+            if output_dir is not None:
+                output_path = Path(output_dir) / (filename[:-3] if decompress else filename)
+            if output_path is not None and not output_path.exists():
+                if decompress:
+                    print(f"  Downloading and decompressing: {output_path.name}")
+                    write_decompressed(response, output_path)
+                else:
+                    print(f"  Downloading: {output_path.name}")
+                    write_response(response, output_path, show_progress=False)
+            # Otherwise leaving the block aborts the body at byte 0
+        print(f"Found dataset: {date_str}")
+        write_cached_date(date_str)
+        return date_str
+    except urllib.error.HTTPError:
+        # Not published yet; only the other candidates need probing
+        potential_dates = potential_dates[1:]
+    except (urllib.error.URLError, http.client.HTTPException, zlib.error, OSError) as e:
+        # Transient failure: keep the candidate at the head of the probe list
+        print(f"  Could not fetch {filename}: {e}")
+
+    # Probe the candidates concurrently, but accept them in priority order
+    with ThreadPoolExecutor(max_workers=PROBE_THREADS) as executor:
+        futures = [
+            executor.submit(check_url_exists, f"{S3_BASE_URL}{date_str}_data.tsv.gz")
+            for date_str in potential_dates
+        ]
+        for date_str, future in zip(potential_dates, futures):
+            if future.result():
+                print(f"Found dataset: {date_str}")
+                write_cached_date(date_str)
+                for pending in futures:
+                    pending.cancel()
+                return date_str
 
     return None
 
 
-def download_with_urllib(url, output_path):
-    """Download a file using urllib with progress indication."""
+def content_range_total(response):
+    """Return the total file size from a 206 response's Content-Range, or None."""
+    total = (response.getheader('Content-Range') or '').rpartition('/')[2]
+    return int(total) if total.isdecimal() else None
+
+
+def write_range(response, output_path, start, end):
+    """
+    Write a 206 response body holding bytes [start, end] at the same offset
+    of output_path. Raises http.client.IncompleteRead if the body is short.
+    """
+    fd = os.open(output_path, os.O_WRONLY)
+    try:
+        offset = start
+        while True:
+            block = response.read(1024 * 1024)
+            if not block:
+                break
+            os.pwrite(fd, block, offset)
+            offset += len(block)
+    finally:
+        os.close(fd)
+    if offset != end + 1:
+        raise http.client.IncompleteRead(b'', end + 1 - offset)
+
+
+def download_range(url, output_path, start, end):
+    """
+    Download bytes [start, end] of url into the same offset of output_path.
+    Returns False if the server ignored the Range header.
+    """
+    with open_url(url, headers={'Range': f'bytes={start}-{end}'}) as response:
+        if response.status != 206:
+            return False
+        write_range(response, output_path, start, end)
+    return True
+
+
+def download_ranged(url, output_path, show_progress=True):
+    """
+    Download url to output_path, fetching large files as parallel byte ranges.
+
+    The first GET asks for the first RANGE_CHUNK_SIZE bytes, so no HEAD is
+    needed: a server that ignores Range, or a file that fits in that range,
+    is streamed straight to output_path. Larger files have their remaining
+    ranges fetched in parallel. Returns False (nothing written) if the file
+    size is unknown or a later range is refused.
+    """
+    with open_url(url, headers={'Range': f'bytes=0-{RANGE_CHUNK_SIZE - 1}'}) as response:
+        size = content_range_total(response) if response.status == 206 else None
+        if response.status != 206 or (size is not None and size <= RANGE_CHUNK_SIZE):
+            write_response(response, output_path, show_progress)
+            return True
+        if size is None:
+            return False
+
+        # Ranges go into a preallocated temporary file, renamed into place
+        # only once every range has arrived, so a failure never leaves a
+        # full-size file that a rerun would skip as complete
+        part_path = f"{output_path}.part"
+        try:
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+
+            ranges = [
+                (start, min(start + RANGE_CHUNK_SIZE, size) - 1)
+                for start in range(RANGE_CHUNK_SIZE, size, RANGE_CHUNK_SIZE)
+            ]
+            with ThreadPoolExecutor(max_workers=RANGE_THREADS) as executor:
+                futures = [executor.submit(download_range, url, part_path, *r) for r in ranges]
+                # The first range streams in this thread while the rest download
+                write_range(response, part_path, 0, RANGE_CHUNK_SIZE - 1)
+                results = [future.result() for future in futures]
+            if all(results):
+                os.replace(part_path, output_path)
+                return True
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    return False
+
+
+def write_response(response, output_path, show_progress=True):
+    """Stream an HTTP response body to output_path in 1 MB blocks."""
+    total_size = int(response.getheader('Content-Length') or 0)
+    downloaded = 0
+    try:
+        with open(output_path, 'wb') as f_out:
+            while True:
+                block = response.read(1024 * 1024)
+                if not block:
+                    break
+                f_out.write(block)
+                downloaded += len(block)
+                if show_progress and total_size > 0:
+                    percent = min(100, downloaded * 100 / total_size)
+                    mb_downloaded = downloaded / (1024 * 1024)
+                    mb_total = total_size / (1024 * 1024)
+                    print(f"\r    Progress: {percent:.1f}% ({mb_downloaded:.1f}/{mb_total:.1f} MB)", end="", flush=True)
+        # read(amt) returns a short body without raising when the connection drops
+        if downloaded < total_size:
+            raise http.client.IncompleteRead(b'', total_size - downloaded)
+    except (http.client.HTTPException, OSError):
+        # Don't leave a truncated file that a rerun would skip as complete
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    if show_progress:
+        print()  # New line after progress
+
+
+def write_decompressed(response, output_path):
+    """Gunzip a readable stream (HTTP response or open .gz file) into output_path."""
+    try:
+        with open(output_path, 'wb') as f_out:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            in_member = False
+            while True:
+                block = response.read(4 * 1024 * 1024)
+                if not block:
+                    break
+                while block:
+                    f_out.write(decompressor.decompress(block))
+                    in_member = True
+                    # Concatenated gzip members: restart on the leftover bytes
+                    if decompressor.eof:
+                        block = decompressor.unused_data
+                        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                        in_member = False
+                    else:
+                        block = b''
+            f_out.write(decompressor.flush())
+            if in_member:
+                raise zlib.error("compressed data ended before the end-of-stream marker")
+    except (zlib.error, OSError):
+        # Don't leave a truncated file that a rerun would skip as complete
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+
+def download_with_urllib(url, output_path, show_progress=True):
+    """Download a file over a kept-alive HTTP connection with progress indication."""
     try:
         print(f"  Downloading: {os.path.basename(output_path)}")
 
-        def report_progress(block_num, block_size, total_size):
-            if total_size > 0:
-                downloaded = block_num * block_size
-                percent = min(100, downloaded * 100 / total_size)
-                mb_downloaded = downloaded / (1024 * 1024)
-                mb_total = total_size / (1024 * 1024)
-                print(f"\r    Progress: {percent:.1f}% ({mb_downloaded:.1f}/{mb_total:.1f} MB)", end="", flush=True)
+        if not download_ranged(url, output_path, show_progress):
+            with open_url(url) as response:
+                write_response(response, output_path, show_progress)
+        print(f"  Finished: {os.path.basename(output_path)}")
+        return True
+    except urllib.error.HTTPError as e:
+        print(f"\n  Error: HTTP {e.code} - {e.reason}")
+        return False
+    except urllib.error.URLError as e:
+        print(f"\n  Error: {e.reason}")
+        return False
+    except (http.client.HTTPException, OSError) as e:
+        # Dropped connections mid-body (IncompleteRead, ConnectionResetError)
+        print(f"\n  Error: {e!r}")
+        return False
 
-        urllib.request.urlretrieve(url, output_path, reporthook=report_progress)
-        print()  # New line after progress
+
+def download_decompressed(url, output_path):
+    """
+    Download a .gz file and gunzip it while streaming, writing only the
+    decompressed output (no intermediate .gz on disk).
+    """
+    try:
+        print(f"  Downloading and decompressing: {os.path.basename(output_path)}")
+        # Identity encoding so the server does not wrap the gzip payload again
+        with open_url(url, headers={'Accept-Encoding': 'identity'}) as response:
+            write_decompressed(response, output_path)
+        print(f"  Finished: {os.path.basename(output_path)}")
         return True
     except urllib.error.HTTPError as e:
         print(f"\n  Error: HTTP {e.code} - {e.reason}")
@@ -238,14 +588,18 @@ def download_with_urllib(url, output_path):
     except urllib.error.URLError as e:
         print(f"\n  Error: {e.reason}")
         return False
+    except (zlib.error, OSError) as e:
+        print(f"\n  Error decompressing {os.path.basename(output_path)}: {e}")
+        return False
 
 
-def download_with_wget(url, output_path):
+def download_with_wget(url, output_path, show_progress=True):
     """Download a file using wget."""
     print(f"  Downloading with wget: {os.path.basename(output_path)}")
+    progress_args = ["--show-progress"] if show_progress else []
     try:
         result = subprocess.run(
-            ["wget", "-q", "--show-progress", "-O", output_path, url],
+            ["wget", "-q", *progress_args, "-O", output_path, url],
             check=True
         )
         return True
@@ -256,12 +610,13 @@ def download_with_wget(url, output_path):
         return False
 
 
-def download_with_curl(url, output_path):
+def download_with_curl(url, output_path, show_progress=True):
     """Download a file using curl."""
     print(f"  Downloading with curl: {os.path.basename(output_path)}")
+    progress_args = ["-#"] if show_progress else ["-sS"]
     try:
         result = subprocess.run(
-            ["curl", "-L", "-#", "-o", output_path, url],
+            ["curl", "-L", *progress_args, "-o", output_path, url],
             check=True
         )
         return True
@@ -289,12 +644,12 @@ def decompress_gzip(gz_path):
         return False
     except FileNotFoundError:
         # Fallback to Python gzip if gunzip not available
-        print(f"  gunzip not found, using Python gzip (may use more memory)...")
+        print(f"  gunzip not found, using Python zlib...")
         output_path = gz_path[:-3]
         try:
-            with gzip.open(gz_path, 'rb') as f_in:
-                with open(output_path, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out, length=1024*1024)  # 1MB chunks
+            # Raw zlib inflate in 4MB blocks, skipping GzipFile's buffering
+            with open(gz_path, 'rb', buffering=0) as f_in:
+                write_decompressed(f_in, output_path)
             os.remove(gz_path)
             return True
         except Exception as e:
@@ -302,6 +657,38 @@ def decompress_gzip(gz_path):
             return False
 
 
+def download_one(download_func, url, output_path, decompress, stream_decompress=False):
+    """Download a single file and optionally decompress it. Returns True on success."""
+    if decompress and output_path.endswith('.gz') and stream_decompress:
+        return download_decompressed(url, output_path[:-3])
+    if not download_func(url, output_path):
+        return False
+    if decompress and output_path.endswith('.gz'):
+        decompress_gzip(output_path)
+    return True
+
+
+def download_all(jobs, download_func, threads, stream_decompress=False):
+    """
+    Download (url, output_path, decompress) jobs concurrently.
+    With stream_decompress, .gz files are decompressed during the download.
+    Returns (successful, failed) counts.
+    """
+    successful = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        futures = [
+            executor.submit(download_one, download_func, *job, stream_decompress)
+            for job in jobs
+        ]
+        for future in futures:
+            if future.result():
+                successful += 1
+            else:
+                failed += 1
+    return successful, failed
+
+
 def main():
     args = parse_args()
 
@@ -312,7 +699,13 @@ def main():
     # Determine date
     date_str = args.date
     if date_str is None:
-        date_str = find_latest_date()
+        # The search GET doubles as the data.tsv.gz download when that file is wanted
+        prefetch = (
+            "data.tsv.gz" in FILE_CATEGORIES[args.category]
+            and not args.dry_run
+            and not (args.use_wget or args.use_curl)
+        )
+        date_str = find_latest_date(output_dir if prefetch else None, args.decompress, not args.no_cache)
         if date_str is None:
             print("Error: Could not find available dataset. Please specify --date manually.")
             print("Example: --date 14Apr2025")
@@ -321,13 +714,14 @@ def main():
     # Get files to download
     files_to_download = FILE_CATEGORIES[args.category]
 
-    # Select download method
+    # Select download method (per-file progress bars only make sense one at a time)
     if args.use_wget:
         download_func = download_with_wget
     elif args.use_curl:
         download_func = download_with_curl
     else:
         download_func = download_with_urllib
+    download_func = partial(download_func, show_progress=args.threads <= 1)
 
     print(f"\nINPHARED Data Download")
     print("=" * 60)
@@ -349,55 +743,44 @@ def main():
             print(f"  {ADDITIONAL_FILES['genomesdb_archive']}")
         return 0
 
-    # Download main files
+    # Collect files to download: (url, output_path, decompress)
+    jobs = []
     successful = 0
-    failed = 0
 
-    print(f"\nDownloading {args.category} files...")
+    print(f"\nDownloading {args.category} files ({args.threads} concurrent)...")
     for suffix in files_to_download:
         filename = f"{date_str}_{suffix}"
         url = f"{S3_BASE_URL}{filename}"
         output_path = output_dir / filename
 
-        if output_path.exists():
+        if output_path.exists() or (args.decompress and output_path.with_suffix('').exists()):
             print(f"  Skipping (exists): {filename}")
             successful += 1
             continue
 
-        if download_func(url, str(output_path)):
-            successful += 1
-            if args.decompress and str(output_path).endswith('.gz'):
-                decompress_gzip(str(output_path))
-        else:
-            failed += 1
+        jobs.append((url, str(output_path), args.decompress))
 
-    # Download additional files if requested
+    # Additional files if requested
     if args.include_phrogs:
-        print("\nDownloading PHROGs HMM database...")
-        url = ADDITIONAL_FILES['phrogs_hmm']
         output_path = output_dir / "all_phrogs.hmm.gz"
         if not output_path.exists():
-            if download_func(url, str(output_path)):
-                successful += 1
-                if args.decompress:
-                    decompress_gzip(str(output_path))
-            else:
-                failed += 1
+            jobs.append((ADDITIONAL_FILES['phrogs_hmm'], str(output_path), args.decompress))
         else:
             print(f"  Skipping (exists): all_phrogs.hmm.gz")
 
     if args.include_genomesdb:
-        print("\nDownloading GenomesDB archive (this may take a while)...")
-        url = ADDITIONAL_FILES['genomesdb_archive']
         output_path = output_dir / "GenomesDB12102022.tar.gz"
         if not output_path.exists():
-            if download_func(url, str(output_path)):
-                successful += 1
-            else:
-                failed += 1
+            print("  GenomesDB archive is large; this may take a while")
+            jobs.append((ADDITIONAL_FILES['genomesdb_archive'], str(output_path), False))
         else:
             print(f"  Skipping (exists): GenomesDB12102022.tar.gz")
 
+    # urllib downloads are gunzipped while streaming; wget/curl decompress afterwards
+    stream_decompress = not (args.use_wget or args.use_curl)
+    downloaded, failed = download_all(jobs, download_func, args.threads, stream_decompress)
+    successful += downloaded
+
     # Summary
     print("\n" + "=" * 60)
     print("Download Summary")
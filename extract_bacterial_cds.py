@@ -19,9 +19,18 @@ Usage:
 
 import argparse
 import csv
+import mmap
+import os
+import random
 import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
 from pathlib import Path
-from Bio import SeqIO
+
+import numpy as np
+import pandas as pd
 
 
 def parse_args():
@@ -82,9 +91,18 @@ def parse_args():
         default=200,
         help="Minimum alignment length for BLAST hit filtering (default: 200)"
     )
+    parser.add_argument(
+        "--threads", "-t",
+        type=int,
+        default=None,
+        help="Number of genomes to process in parallel (default: all CPUs)"
+    )
     return parser.parse_args()
 
 
+# Base seed for per-genome CDS sampling
+RANDOM_SEED = 42
+
 # Keywords that indicate phage-related annotations
 PHAGE_KEYWORDS = [
     'phage', 'prophage', 'viral', 'virus', 'bacteriophage',
@@ -97,114 +115,222 @@ PHAGE_KEYWORDS = [
 ]
 
 
+# All PHAGE_KEYWORDS as one case-insensitive pattern, matched anywhere in the text
+PHAGE_PATTERN = re.compile('|'.join(re.escape(keyword) for keyword in PHAGE_KEYWORDS), re.IGNORECASE)
+
+
 def is_phage_related(product, note=""):
     """Check if a CDS annotation suggests phage origin."""
-    text = (product + " " + note).lower()
+    return bool(PHAGE_PATTERN.search(product) or (note and PHAGE_PATTERN.search(note)))
 
-    for keyword in PHAGE_KEYWORDS:
-        if keyword in text:
-            return True
 
-    return False
+# Minimum bp a CDS must share with a BLAST hit to count as overlapping
+MIN_OVERLAP = 50
 
 
-def load_blast_hits_by_contig(blast_file, min_identity=90.0, min_length=200):
+# Rows per pandas chunk when reading BLAST results
+BLAST_CHUNK_SIZE = 1_000_000
+
+
+def load_blast_hits_by_contig(blast_file, min_identity=90.0, min_length=200, min_overlap=MIN_OVERLAP):
     """Load significant BLAST hits organized by contig.
 
-    Returns dict: {contig_id: [(start, end), ...]}
+    Returns dict: {contig_id: (starts, reach)} where starts is sorted and
+    reach[i] is the furthest end among hits 0..i at least min_overlap bp long.
 
     BLAST output format 6 columns:
     0: qseqid, 1: sseqid, 2: pident, 3: length, 4: mismatch, 5: gapopen,
     6: qstart, 7: qend, 8: sstart, 9: send, 10: evalue, 11: bitscore
     """
-    hits_by_contig = {}
-
-    with open(blast_file, 'r') as f:
-        for line in f:
-            parts = line.strip().split('\t')
-            if len(parts) < 10:
-                continue
-
-            try:
-                contig = parts[1]  # subject (bacterial contig)
-                identity = float(parts[2])
-                length = int(parts[3])
-                sstart = int(parts[8])
-                send = int(parts[9])
-            except (ValueError, IndexError):
-                continue
+    contigs, starts, ends = [], [], []
+
+    try:
+        chunks = pd.read_csv(
+            blast_file,
+            sep='\t',
+            header=None,
+            usecols=[1, 2, 3, 8, 9],
+            quoting=csv.QUOTE_NONE,
+            chunksize=BLAST_CHUNK_SIZE,
+        )
+        for chunk in chunks:
+            # Columns with unparseable values come back as strings; drop those rows
+            for col in (2, 3, 8, 9):
+                if not pd.api.types.is_numeric_dtype(chunk[col]):
+                    chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+            chunk = chunk.dropna()
 
             # Only keep significant hits
-            if identity >= min_identity and length >= min_length:
-                # Normalize coordinates (start < end)
-                start = min(sstart, send)
-                end = max(sstart, send)
+            chunk = chunk[(chunk[2] >= min_identity) & (chunk[3] >= min_length)]
+
+            # Normalize coordinates (start < end)
+            sstart = chunk[8].to_numpy(dtype=np.int64)
+            send = chunk[9].to_numpy(dtype=np.int64)
+            contigs.append(chunk[1].astype(str).to_numpy())
+            starts.append(np.minimum(sstart, send))
+            ends.append(np.maximum(sstart, send))
+    except pd.errors.EmptyDataError:
+        pass
+
+    if not contigs or not sum(map(len, contigs)):
+        return {}
+
+    codes, names = pd.factorize(np.concatenate(contigs))
+    starts = np.concatenate(starts)
+    ends = np.concatenate(ends)
+
+    # Sort by contig, then start, then end; each contig is one contiguous run
+    order = np.lexsort((ends, starts, codes))
+    codes, starts, ends = codes[order], starts[order], ends[order]
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(names)))))
+
+    # Running max of ends within each contig, done for all contigs at once by
+    # offsetting each contig's values above the previous contig's. Hits
+    # shorter than min_overlap can never overlap a CDS by that much.
+    floor = ends.min() - 1
+    shifted = np.where(ends - starts >= min_overlap, ends - floor, 0)
+    offsets = codes.astype(np.int64) * (shifted.max() + 1)
+    shifted = np.maximum.accumulate(shifted + offsets) - offsets
+    reach = np.where(shifted > 0, shifted + floor, np.iinfo(np.int64).min)
 
-                if contig not in hits_by_contig:
-                    hits_by_contig[contig] = []
-                hits_by_contig[contig].append((start, end))
+    hits_by_contig = {}
+    for i, contig in enumerate(names):
+        hits_by_contig[contig] = (starts[bounds[i]:bounds[i + 1]], reach[bounds[i]:bounds[i + 1]])
 
     return hits_by_contig
 
 
-def overlaps_blast_hit(contig, cds_start, cds_end, hits_by_contig, min_overlap=50):
+def overlaps_blast_hit(contig, cds_start, cds_end, hits_by_contig, min_overlap=MIN_OVERLAP):
     """Check if a CDS overlaps with any significant BLAST hit.
 
     Returns True if there's an overlap of at least min_overlap bp.
     """
-    if contig not in hits_by_contig:
+    if contig not in hits_by_contig or cds_end - cds_start < min_overlap:
         return False
 
-    for hit_start, hit_end in hits_by_contig[contig]:
-        # Calculate overlap
-        overlap_start = max(cds_start, hit_start)
-        overlap_end = min(cds_end, hit_end)
-        overlap = overlap_end - overlap_start
+    # A hit overlaps enough iff it starts by cds_end - min_overlap and
+    # ends at or after cds_start + min_overlap
+    starts, reach = hits_by_contig[contig]
+    i = np.searchsorted(starts, cds_end - min_overlap, side='right')
 
-        if overlap >= min_overlap:
-            return True
+    return i > 0 and reach[i - 1] >= cds_start + min_overlap
 
-    return False
 
+# One CDS row from a GFF3 file
+CDSFeature = namedtuple('CDSFeature', [
+    'seqid', 'start', 'end', 'strand', 'id', 'product', 'name', 'note', 'locus_tag',
+])
 
-def parse_gff3(gff_file):
-    """Parse GFF3 file and extract CDS features."""
-    cds_features = []
+# One sampled CDS with its extracted sequence
+ExtractedCDS = namedtuple('ExtractedCDS', [
+    'cds_id', 'accession', 'contig', 'start', 'end', 'strand', 'length', 'product', 'sequence',
+])
 
-    with open(gff_file, 'r') as f:
-        for line in f:
-            if line.startswith('#'):
-                continue
+# Column names of the nine GFF3 fields
+GFF3_COLUMNS = ['seqid', 'source', 'type', 'start', 'end', 'score', 'strand', 'phase', 'attributes']
 
-            parts = line.strip().split('\t')
-            if len(parts) < 9:
-                continue
 
-            seqid, source, feature_type, start, end, score, strand, phase, attributes = parts
+# GFF3 attribute keys read from CDS rows, each with a precompiled key=value pattern
+ATTRIBUTE_PATTERNS = {
+    key: re.compile(f'(?:^|;){key}=([^;]*)')
+    for key in ('ID', 'product', 'Product', 'Name', 'note', 'Note', 'locus_tag')
+}
 
-            if feature_type != 'CDS':
-                continue
 
-            # Parse attributes
-            attr_dict = {}
-            for attr in attributes.split(';'):
-                if '=' in attr:
-                    key, value = attr.split('=', 1)
-                    attr_dict[key] = value
+def extract_attribute(attributes, key, fallback=None):
+    """Pull one key=value attribute out of a Series of GFF3 attribute strings.
+
+    Rows without key are retried with the fallback key, if given.
+    """
+    values = attributes.str.extract(ATTRIBUTE_PATTERNS[key], expand=False)
+
+    if fallback is not None:
+        missing = values.isna()
+        if missing.any():
+            values[missing] = attributes[missing].str.extract(ATTRIBUTE_PATTERNS[fallback], expand=False)
+
+    return values
 
-            cds_features.append({
-                'seqid': seqid,
-                'start': int(start),
-                'end': int(end),
-                'strand': strand,
-                'id': attr_dict.get('ID', ''),
-                'product': attr_dict.get('product', attr_dict.get('Product', '')),
-                'name': attr_dict.get('Name', ''),
-                'note': attr_dict.get('note', attr_dict.get('Note', '')),
-                'locus_tag': attr_dict.get('locus_tag', ''),
-            })
 
-    return cds_features
+def parse_gff3(gff_file):
+    """Parse GFF3 file and extract CDS features."""
+    # pandas cannot memory-map an empty file
+    if os.path.getsize(gff_file) == 0:
+        return []
+
+    try:
+        gff = pd.read_csv(
+            gff_file,
+            sep='\t',
+            header=None,
+            names=GFF3_COLUMNS,
+            dtype=str,
+            keep_default_na=False,
+            quoting=csv.QUOTE_NONE,
+            memory_map=True,
+        )
+    except pd.errors.EmptyDataError:
+        return []
+
+    # Comment/directive lines, the trailing ##FASTA block and short rows
+    # all fail one of these tests
+    gff = gff[(gff['type'] == 'CDS') & (gff['attributes'] != '') & ~gff['seqid'].str.startswith('#')]
+    attributes = gff['attributes'].str.rstrip()
+
+    # Columns in CDSFeature field order
+    cds_features = pd.DataFrame({
+        'seqid': gff['seqid'],
+        'start': gff['start'].astype(int),
+        'end': gff['end'].astype(int),
+        'strand': gff['strand'],
+        'id': extract_attribute(attributes, 'ID'),
+        'product': extract_attribute(attributes, 'product', fallback='Product'),
+        'name': extract_attribute(attributes, 'Name'),
+        'note': extract_attribute(attributes, 'note', fallback='Note'),
+        'locus_tag': extract_attribute(attributes, 'locus_tag'),
+    }).fillna('')
+
+    return list(map(CDSFeature._make, cds_features.itertuples(index=False, name=None)))
+
+
+# Complement table covering IUPAC ambiguity codes in both cases (as Biopython)
+REVERSE_COMPLEMENT = bytes.maketrans(
+    b'ACGTUMRWSYKVHDBNacgtumrwsykvhdbn',
+    b'TGCAAKYWSRMBDHVNtgcaakywsrmbdhvn',
+)
+
+
+def load_fasta_bytes(fasta_file):
+    """Load a FASTA file as {seqid: sequence bytes}, keyed by the first header word."""
+    genome_seqs = {}
+
+    with open(fasta_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return genome_seqs
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Skip anything before the first record, as SeqIO does
+            if mm[:1] == b'>':
+                start = 0
+            else:
+                start = mm.find(b'\n>')
+                if start != -1:
+                    start += 1
+
+            while start != -1:
+                next_record = mm.find(b'\n>', start)
+                stop = len(mm) if next_record == -1 else next_record
+                header_end = mm.find(b'\n', start, stop)
+                if header_end == -1:
+                    header_end = stop
+
+                words = mm[start + 1:header_end].split(None, 1)
+                seqid = words[0].decode() if words else ''
+                genome_seqs[seqid] = mm[header_end:stop].translate(None, b'\r\n ')
+
+                start = next_record + 1 if next_record != -1 else -1
+
+    return genome_seqs
 
 
 def extract_sequence(genome_seqs, seqid, start, end, strand):
@@ -215,9 +341,166 @@ def extract_sequence(genome_seqs, seqid, start, end, strand):
     seq = genome_seqs[seqid][start-1:end]  # GFF is 1-based
 
     if strand == '-':
-        seq = seq.reverse_complement()
+        seq = seq.translate(REVERSE_COMPLEMENT)[::-1]
+
+    return seq.decode()
+
+
+def share_blast_hits(hits_by_contig):
+    """Copy all BLAST hit arrays into one shared memory block.
+
+    Returns (shm, index) where index maps contig -> (offset, count) into a
+    (2, total_hits) int64 array of starts and reach, or (None, {}) if empty.
+    """
+    total_hits = sum(len(starts) for starts, _ in hits_by_contig.values())
+    if total_hits == 0:
+        return None, {}
+
+    shm = shared_memory.SharedMemory(create=True, size=2 * total_hits * 8)
+    hits = np.ndarray((2, total_hits), dtype=np.int64, buffer=shm.buf)
+
+    index = {}
+    offset = 0
+    for contig, (starts, reach) in hits_by_contig.items():
+        count = len(starts)
+        hits[0, offset:offset + count] = starts
+        hits[1, offset:offset + count] = reach
+        index[contig] = (offset, count)
+        offset += count
+
+    return shm, index
+
+
+# BLAST hits for the current worker process, set once by init_worker as
+# views into the shared memory block
+_hits_shm = None
+_hits_by_contig = {}
+
+
+def init_worker(shm_name, index):
+    """Attach each worker to the shared BLAST hits instead of copying them."""
+    global _hits_shm, _hits_by_contig
+    if shm_name is None:
+        return
+
+    _hits_shm = shared_memory.SharedMemory(name=shm_name)
+    total_hits = sum(count for _, count in index.values())
+    hits = np.ndarray((2, total_hits), dtype=np.int64, buffer=_hits_shm.buf)
+    _hits_by_contig = {
+        contig: (hits[0, offset:offset + count], hits[1, offset:offset + count])
+        for contig, (offset, count) in index.items()
+    }
+
+
+def process_one_accession(accession, annotations_dir, args):
+    """Filter and extract the CDS of one genome.
+
+    Returns (genome_cds, stats, warning); warning is set when the genome
+    has no usable annotation files.
+    """
+    stats = {
+        'total_cds': 0,
+        'phage_related': 0,
+        'hypothetical': 0,
+        'too_short': 0,
+        'too_long': 0,
+        'blast_overlap': 0,
+        'extracted': 0,
+    }
+
+    # Find annotation files
+    acc_dir = annotations_dir / accession
+
+    if not acc_dir.exists():
+        return [], stats, f"No annotations for {accession}"
+
+    # Find GFF3 and FNA files
+    gff_files = list(acc_dir.glob("*.gff3"))
+    fna_files = list(acc_dir.glob("*.fna"))
 
-    return str(seq.seq)
+    if not gff_files:
+        return [], stats, f"No GFF3 for {accession}"
+    if not fna_files:
+        return [], stats, f"No FNA for {accession}"
+
+    gff_file = gff_files[0]
+    fna_file = fna_files[0]
+
+    # Load genome sequences
+    genome_seqs = load_fasta_bytes(fna_file)
+
+    # Parse GFF3
+    cds_features = parse_gff3(gff_file)
+    stats['total_cds'] += len(cds_features)
+
+    # Filter CDS, keeping a uniform sample of at most max_per_genome
+    # via reservoir sampling (Algorithm R)
+    sampled = []
+    candidates = 0
+    # Seeded per genome so samples differ between genomes but do not
+    # depend on which worker process handles which genome
+    rng = random.Random(f"{RANDOM_SEED}:{accession}")
+
+    for cds in cds_features:
+        length = cds.end - cds.start + 1
+
+        # Check length
+        if length < args.min_length:
+            stats['too_short'] += 1
+            continue
+        if length > args.max_length:
+            stats['too_long'] += 1
+            continue
+
+        # Check if phage-related by annotation
+        if is_phage_related(cds.product, cds.note):
+            stats['phage_related'] += 1
+            continue
+
+        # Check if overlaps with BLAST hit (phage similarity)
+        if _hits_by_contig and overlaps_blast_hit(cds.seqid, cds.start, cds.end, _hits_by_contig):
+            stats['blast_overlap'] += 1
+            continue
+
+        # Optionally exclude hypothetical
+        if args.exclude_hypothetical:
+            if 'hypothetical' in cds.product.lower():
+                stats['hypothetical'] += 1
+                continue
+
+        if cds.seqid not in genome_seqs:
+            continue
+
+        candidates += 1
+        if len(sampled) < args.max_per_genome:
+            sampled.append(cds)
+        else:
+            slot = rng.randrange(candidates)
+            if slot < args.max_per_genome:
+                sampled[slot] = cds
+
+    # Extract sequences only for the sampled CDS
+    genome_cds = []
+
+    for cds in sampled:
+        seq = extract_sequence(genome_seqs, cds.seqid, cds.start, cds.end, cds.strand)
+        cds_id = f"{accession}_{cds.locus_tag}_{cds.start}_{cds.end}"
+
+        genome_cds.append(ExtractedCDS(
+            cds_id=cds_id,
+            accession=accession,
+            contig=cds.seqid,
+            start=cds.start,
+            end=cds.end,
+            strand=cds.strand,
+            length=cds.end - cds.start + 1,
+            product=cds.product,
+            sequence=seq,
+        ))
+
+    stats['extracted'] += len(genome_cds)
+
+    return genome_cds, stats, None
 
 
 def main():
@@ -246,19 +529,18 @@ def main():
             min_identity=args.min_identity,
             min_length=args.min_blast_length
         )
-        total_hits = sum(len(hits) for hits in hits_by_contig.values())
+        total_hits = sum(len(starts) for starts, _ in hits_by_contig.values())
         print(f"  Loaded {total_hits:,} significant hits across {len(hits_by_contig):,} contigs")
         print()
 
     # Load accessions
     with open(args.accessions, 'r') as f:
-        accessions = [line.strip() for line in f if line.strip()]
+        accessions = [acc for acc in map(str.strip, f) if acc]
 
     print(f"Processing {len(accessions)} genomes...")
+    print(f"Writing to {args.output}...")
     print()
 
-    # Collect all CDS
-    all_cds = []
     stats = {
         'total_cds': 0,
         'phage_related': 0,
@@ -269,95 +551,46 @@ def main():
         'extracted': 0,
     }
 
-    for accession in accessions:
-        # Find annotation files
-        acc_dir = annotations_dir / accession
-
-        if not acc_dir.exists():
-            print(f"  Warning: No annotations for {accession}")
-            continue
-
-        # Find GFF3 and FNA files
-        gff_files = list(acc_dir.glob("*.gff3"))
-        fna_files = list(acc_dir.glob("*.fna"))
-
-        if not gff_files:
-            print(f"  Warning: No GFF3 for {accession}")
-            continue
-        if not fna_files:
-            print(f"  Warning: No FNA for {accession}")
-            continue
-
-        gff_file = gff_files[0]
-        fna_file = fna_files[0]
-
-        # Load genome sequences
-        genome_seqs = SeqIO.to_dict(SeqIO.parse(fna_file, "fasta"))
-
-        # Parse GFF3
-        cds_features = parse_gff3(gff_file)
-        stats['total_cds'] += len(cds_features)
-
-        # Filter and extract CDS
-        genome_cds = []
-
-        for cds in cds_features:
-            length = cds['end'] - cds['start'] + 1
-
-            # Check length
-            if length < args.min_length:
-                stats['too_short'] += 1
-                continue
-            if length > args.max_length:
-                stats['too_long'] += 1
-                continue
-
-            # Check if phage-related by annotation
-            if is_phage_related(cds['product'], cds['note']):
-                stats['phage_related'] += 1
-                continue
-
-            # Check if overlaps with BLAST hit (phage similarity)
-            if hits_by_contig and overlaps_blast_hit(cds['seqid'], cds['start'], cds['end'], hits_by_contig):
-                stats['blast_overlap'] += 1
-                continue
-
-            # Optionally exclude hypothetical
-            if args.exclude_hypothetical:
-                if 'hypothetical' in cds['product'].lower():
-                    stats['hypothetical'] += 1
+    # Workers read the BLAST hits from shared memory rather than each
+    # receiving its own pickled copy
+    hits_shm, hits_index = share_blast_hits(hits_by_contig)
+    del hits_by_contig
+
+    try:
+        # Write each genome's CDS as soon as it is done so only one genome's
+        # sequences are held in memory
+        with open(args.output, 'w', newline='') as f, ProcessPoolExecutor(
+            max_workers=args.threads,
+            initializer=init_worker,
+            initargs=(hits_shm.name if hits_shm else None, hits_index),
+        ) as executor:
+            writer = csv.writer(f)
+            writer.writerow(['segment_id', 'sequence', 'label', 'source', 'product', 'length'])
+
+            process = partial(process_one_accession, annotations_dir=annotations_dir, args=args)
+            for accession, (genome_cds, genome_stats, warning) in zip(
+                    accessions, executor.map(process, accessions, chunksize=4)):
+                if warning:
+                    print(f"  Warning: {warning}")
                     continue
 
-            # Extract sequence
-            seq = extract_sequence(genome_seqs, cds['seqid'], cds['start'], cds['end'], cds['strand'])
-            if seq is None:
-                continue
-
-            cds_id = f"{accession}_{cds['locus_tag']}_{cds['start']}_{cds['end']}"
-
-            genome_cds.append({
-                'cds_id': cds_id,
-                'accession': accession,
-                'contig': cds['seqid'],
-                'start': cds['start'],
-                'end': cds['end'],
-                'strand': cds['strand'],
-                'length': length,
-                'product': cds['product'],
-                'sequence': seq,
-            })
-
-        # Limit per genome
-        if len(genome_cds) > args.max_per_genome:
-            # Sample evenly across the genome
-            import random
-            random.seed(42)
-            genome_cds = random.sample(genome_cds, args.max_per_genome)
+                for key, value in genome_stats.items():
+                    stats[key] += value
 
-        all_cds.extend(genome_cds)
-        stats['extracted'] += len(genome_cds)
+                writer.writerows([
+                    cds.cds_id,
+                    cds.sequence,
+                    0,  # bacteria label
+                    'gtdb_cds',
+                    cds.product,
+                    cds.length,
+                ] for cds in genome_cds)
 
-        print(f"  {accession}: {len(genome_cds)} CDS extracted")
+                print(f"  {accession}: {len(genome_cds)} CDS extracted")
+    finally:
+        if hits_shm is not None:
+            hits_shm.close()
+            hits_shm.unlink()
 
     print()
     print("=" * 60)
@@ -372,25 +605,7 @@ def main():
         print(f"Hypothetical:         {stats['hypothetical']:,} (excluded)")
     print(f"Extracted:            {stats['extracted']:,}")
     print()
-
-    # Write output CSV
-    print(f"Writing to {args.output}...")
-
-    with open(args.output, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['segment_id', 'sequence', 'label', 'source', 'product', 'length'])
-
-        for cds in all_cds:
-            writer.writerow([
-                cds['cds_id'],
-                cds['sequence'],
-                0,  # bacteria label
-                'gtdb_cds',
-                cds['product'],
-                cds['length'],
-            ])
-
-    print(f"Done! Wrote {len(all_cds):,} CDS to {args.output}")
+    print(f"Done! Wrote {stats['extracted']:,} CDS to {args.output}")
 
 
 if __name__ == "__main__":
@@ -7,10 +7,12 @@ Splitting is done by cluster to prevent data leakage.
 """
 
 import argparse
-import random
-from collections import defaultdict
+import csv
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -42,32 +44,30 @@ def parse_args():
 
 def main():
     args = parse_args()
-    random.seed(args.seed)
 
     print(f"Loading clusters from {args.clusters}...")
 
-    # Load vclust file and extract representatives
-    cluster_to_genomes = defaultdict(list)
-
-    with open(args.clusters, 'r') as f:
-        header = f.readline()  # Skip header
-        for line in f:
-            parts = line.strip().split('\t')
-            if len(parts) >= 2:
-                genome = parts[0]
-                cluster = int(parts[1])
-                cluster_to_genomes[cluster].append(genome)
-
-    # First genome in each cluster is the representative
-    representatives = []
-    cluster_ids = []
+    # Load vclust file; the first genome seen in each cluster is the
+    # representative, so the other members are dropped. Genome names stay
+    # in pandas' compact string array rather than a list of Python str
+    clusters = pd.read_csv(
+        args.clusters,
+        sep='\t',
+        header=0,
+        usecols=[0, 1],
+        dtype={0: str},
+        quoting=csv.QUOTE_NONE,
+        keep_default_na=False,
+        na_values={1: ['']},
+    )
+    clusters.columns = ['genome', 'cluster']
+    clusters = clusters.dropna(subset=['cluster']).astype({'cluster': np.int64})
 
-    for cluster in sorted(cluster_to_genomes.keys()):
-        genomes = cluster_to_genomes[cluster]
-        representatives.append(genomes[0])
-        cluster_ids.append(cluster)
+    # First occurrence of each cluster, ordered by cluster ID
+    cluster_ids, first_idx = np.unique(clusters['cluster'].to_numpy(), return_index=True)
+    representatives = clusters['genome'].array.take(first_idx)
 
-    print(f"  Total clusters: {len(cluster_to_genomes)}")
+    print(f"  Total clusters: {len(cluster_ids)}")
     print(f"  Representatives: {len(representatives)}")
 
     # Parse split ratio
@@ -76,12 +76,10 @@ def main():
     train_frac = parts[0] / total
     dev_frac = parts[1] / total
 
-    # Shuffle clusters for random split
-    combined = list(zip(cluster_ids, representatives))
-    random.shuffle(combined)
-    cluster_ids, representatives = zip(*combined)
-    cluster_ids = list(cluster_ids)
-    representatives = list(representatives)
+    # Shuffle clusters for random split by permuting one index array
+    perm = np.random.default_rng(args.seed).permutation(len(representatives))
+    cluster_ids = cluster_ids[perm]
+    representatives = representatives.take(perm)
 
     # Split by cluster count
     n = len(representatives)
@@ -102,45 +100,37 @@ def main():
     print(f"  Dev: {len(dev_genomes)} genomes ({len(dev_clusters)} clusters)")
     print(f"  Test: {len(test_genomes)} genomes ({len(test_clusters)} clusters)")
 
-    # Verify no overlap
-    train_set = set(train_clusters)
-    dev_set = set(dev_clusters)
-    test_set = set(test_clusters)
-
-    assert len(train_set & dev_set) == 0, "Train-Dev cluster overlap!"
-    assert len(train_set & test_set) == 0, "Train-Test cluster overlap!"
-    assert len(dev_set & test_set) == 0, "Dev-Test cluster overlap!"
+    # Verify no overlap: each cluster appears once and the splits are
+    # contiguous slices, so non-overlapping bounds imply disjoint clusters
+    assert 0 <= train_end <= dev_end <= n, "Split bounds overlap!"
     print("\n  No cluster overlap - no data leakage!")
 
     # Save outputs
     output_dir = Path(args.output)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    for split_name, genomes, clusters in [
-        ("train", train_genomes, train_clusters),
-        ("dev", dev_genomes, dev_clusters),
-        ("test", test_genomes, test_clusters)
-    ]:
-        # Save accession list
-        acc_file = output_dir / f"{split_name}_accessions.txt"
-        with open(acc_file, 'w') as f:
-            for g in genomes:
-                f.write(f"{g}\n")
-
-        # Save with cluster info
-        cluster_file = output_dir / f"{split_name}_with_clusters.tsv"
-        with open(cluster_file, 'w') as f:
-            f.write("accession\tcluster\n")
-            for g, c in zip(genomes, clusters):
-                f.write(f"{g}\t{c}\n")
-
-        print(f"  Saved {acc_file}")
-
-    # Save all representatives
+    # All representatives are written in split order alongside each split
     all_file = output_dir / "all_representatives.txt"
-    with open(all_file, 'w') as f:
-        for g in train_genomes + dev_genomes + test_genomes:
-            f.write(f"{g}\n")
+    with open(all_file, 'w') as all_f:
+        for split_name, genomes, clusters in [
+            ("train", train_genomes, train_clusters),
+            ("dev", dev_genomes, dev_clusters),
+            ("test", test_genomes, test_clusters)
+        ]:
+            # Save accession list
+            accession_lines = ''.join(f"{g}\n" for g in genomes)
+            acc_file = output_dir / f"{split_name}_accessions.txt"
+            with open(acc_file, 'w') as f:
+                f.write(accession_lines)
+            all_f.write(accession_lines)
+
+            # Save with cluster info
+            cluster_file = output_dir / f"{split_name}_with_clusters.tsv"
+            with open(cluster_file, 'w') as f:
+                f.write("accession\tcluster\n")
+                f.write(''.join(f"{g}\t{c}\n" for g, c in zip(genomes, clusters)))
+
+            print(f"  Saved {acc_file}")
 
     # Save summary
     summary_file = output_dir / "summary.txt"
@@ -16,9 +16,28 @@ Usage:
 """
 
 import argparse
-from collections import defaultdict
+import csv
+import heapq
+import os
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from itertools import islice
 from pathlib import Path
 
+import pandas as pd
+
+
+# Read buffer for the (multi-GB) BLAST results and large metadata inputs
+READ_BUFFER_SIZE = 1 << 20
+
+# Prefixes GTDB adds to GenBank (GB_) and RefSeq (RS_) accessions
+GTDB_PREFIXES = frozenset(('GB_', 'RS_'))
+
+# Phylum rank of a GTDB taxonomy string (e.g. "d__Bacteria;p__Bacillota;...")
+PHYLUM_PATTERN = re.compile(r'(?:^|;)p__([^;]*)')
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -64,80 +83,126 @@ def parse_args():
         action="store_true",
         help="Try to balance selection across phyla"
     )
+    parser.add_argument(
+        "--threads", "-t",
+        type=int,
+        default=None,
+        help="Number of processes scanning the BLAST results (default: all CPUs)"
+    )
     return parser.parse_args()
 
 
 def normalize_accession(acc):
     """Normalize accession by removing GB_/RS_ prefix."""
-    if acc.startswith('GB_'):
-        return acc[3:]  # Remove GB_
-    elif acc.startswith('RS_'):
-        return acc[3:]  # Remove RS_
-    return acc
+    return acc[3:] if acc[:3] in GTDB_PREFIXES else acc
 
 
 def load_contig_map(contig_map_file):
     """Load contig to genome mapping."""
-    contig_to_genome = {}
-    with open(contig_map_file, 'r') as f:
-        for line in f:
-            parts = line.strip().split('\t')
-            if len(parts) >= 2:
-                # Skip header
-                if parts[0] == 'contig_id' or parts[1] == 'genome_accession':
-                    continue
-                contig_to_genome[parts[0]] = parts[1]
-    return contig_to_genome
+    try:
+        mapping = pd.read_csv(
+            contig_map_file,
+            sep='\t',
+            header=None,
+            usecols=[0, 1],
+            dtype=str,
+            keep_default_na=False,
+            quoting=csv.QUOTE_NONE,
+        )
+    except pd.errors.EmptyDataError:
+        return {}
+
+    contigs, genomes = mapping[0], mapping[1]
+    # Skip header and rows without a genome column
+    keep = (contigs != 'contig_id') & (genomes != 'genome_accession') & (genomes != '')
+    return dict(zip(contigs[keep].to_numpy(), genomes[keep].to_numpy()))
 
 
 def load_accessions(accessions_file):
-    """Load accession list and return both original and normalized versions."""
-    accessions = set()
-    original_to_normalized = {}
-    normalized_to_original = {}
+    """Load accession list in its original (possibly GB_/RS_ prefixed) format."""
+    with open(accessions_file, 'r', buffering=READ_BUFFER_SIZE) as f:
+        return {acc for acc in map(str.strip, f) if acc}
+
+
+def scan_blast_range(blast_file, byte_range, min_identity, min_length):
+    """Return the contigs with a passing hit among lines starting in byte_range.
+
+    A line belongs to the range its first byte falls in, so adjacent ranges
+    split the file without losing or repeating lines.
+    """
+    start, end = byte_range
+    # Contigs that already had a passing hit; later hits on them cannot
+    # change the result, so they are skipped before any parsing
+    settled_contigs = set()
+    # Bound once so the per-line loop uses fast local lookups
+    settle = settled_contigs.add
+
+    # Binary mode skips UTF-8 decoding; contigs are decoded by the caller
+    with open(blast_file, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        pos = start
+        if start:
+            # Skip the rest of a line begun in the previous range
+            f.seek(start - 1)
+            pos += len(f.readline()) - 1
 
-    with open(accessions_file, 'r') as f:
         for line in f:
-            acc = line.strip()
-            if acc:
-                accessions.add(acc)
-                normalized = normalize_accession(acc)
-                original_to_normalized[acc] = normalized
-                normalized_to_original[normalized] = acc
+            if pos >= end:
+                break
+            pos += len(line)
 
-    return accessions, original_to_normalized, normalized_to_original
+            parts = line.split(b'\t', 4)
+            if len(parts) < 4 or parts[1] in settled_contigs:
+                continue
 
+            try:
+                identity = float(parts[2])  # percent identity
+                length = int(parts[3])      # alignment length
+            except ValueError:
+                continue
+
+            # Only count if meets quality thresholds
+            if identity >= min_identity and length >= min_length:
+                # Column 2 is the subject (bacterial contig)
+                settle(parts[1])
 
-def find_genomes_with_hits(blast_file, contig_to_genome, min_identity=90.0, min_length=200):
+    return settled_contigs
+
+
+def find_genomes_with_hits(blast_file, contig_to_genome, min_identity=90.0, min_length=200,
+                           threads=None):
     """Find genomes that have BLAST hits meeting quality thresholds.
 
     Only counts genomes with at least one hit that has:
     - identity >= min_identity (default 90%)
     - alignment length >= min_length (default 200bp)
 
+    The file is split into byte ranges scanned by parallel processes.
+
     BLAST output format 6 columns:
     0: qseqid, 1: sseqid, 2: pident, 3: length, 4: mismatch, 5: gapopen,
     6: qstart, 7: qend, 8: sstart, 9: send, 10: evalue, 11: bitscore
     """
-    genomes_with_hits = set()
+    file_size = os.path.getsize(blast_file)
+    n_ranges = max(1, min(threads or os.cpu_count() or 1, file_size // READ_BUFFER_SIZE))
+    bounds = [file_size * i // n_ranges for i in range(n_ranges + 1)]
+    byte_ranges = list(zip(bounds[:-1], bounds[1:]))
 
-    with open(blast_file, 'r') as f:
-        for line in f:
-            parts = line.strip().split('\t')
-            if len(parts) >= 4:
-                # Column 2 is the subject (bacterial contig)
-                contig = parts[1]
+    genomes_with_hits = set()
 
-                try:
-                    identity = float(parts[2])  # percent identity
-                    length = int(parts[3])      # alignment length
-                except (ValueError, IndexError):
-                    continue
+    def add_hits(contigs):
+        # Map hit contigs to genomes in one C-level pass; unmapped contigs give None
+        genomes_with_hits.update(map(contig_to_genome.get, map(bytes.decode, contigs)))
 
-                # Only count if meets quality thresholds
-                if identity >= min_identity and length >= min_length:
-                    if contig in contig_to_genome:
-                        genomes_with_hits.add(contig_to_genome[contig])
+    scan = partial(scan_blast_range, blast_file,
+                   min_identity=min_identity, min_length=min_length)
+    if n_ranges == 1:
+        add_hits(scan(byte_ranges[0]))
+    else:
+        with ProcessPoolExecutor(max_workers=n_ranges) as executor:
+            # Merge each range as soon as its worker finishes, while others still scan
+            for future in as_completed([executor.submit(scan, r) for r in byte_ranges]):
+                add_hits(future.result())
+    genomes_with_hits.discard(None)
 
     return genomes_with_hits
 
@@ -149,10 +214,18 @@ def load_metadata(metadata_file, accessions_of_interest):
     """
     metadata = {}
 
-    # Create normalized versions for matching
+    # Map every form an accession of interest can take in the metadata (itself,
+    # or its normalized form bare or with either GTDB prefix) to the original
     accessions_normalized = {normalize_accession(acc): acc for acc in accessions_of_interest}
-
-    with open(metadata_file, 'r') as f:
+    original_accession = {}
+    for normalized, acc in accessions_normalized.items():
+        if normalized[:3] not in GTDB_PREFIXES:
+            original_accession[normalized] = acc
+        for prefix in GTDB_PREFIXES:
+            original_accession[prefix + normalized] = acc
+    original_accession.update((acc, acc) for acc in accessions_of_interest)
+
+    with open(metadata_file, 'r', buffering=READ_BUFFER_SIZE) as f:
         header = f.readline().strip().split('\t')
 
         # Find important columns
@@ -163,32 +236,27 @@ def load_metadata(metadata_file, accessions_of_interest):
         size_idx = header.index('genome_size') if 'genome_size' in header else None
 
         for line in f:
+            # Most rows are not of interest; when the accession is the first
+            # column, check it before splitting the rest of the row
+            if acc_idx == 0:
+                if line.strip().split('\t', 1)[0] not in original_accession:
+                    continue
+
             parts = line.strip().split('\t')
             if len(parts) <= acc_idx:
                 continue
             acc = parts[acc_idx]
 
-            # GTDB metadata uses GB_/RS_ prefix
-            acc_normalized = normalize_accession(acc)
-
             # Check if this accession is in our set of interest
-            original_acc = None
-            if acc in accessions_of_interest:
-                original_acc = acc
-            elif acc_normalized in accessions_normalized:
-                original_acc = accessions_normalized[acc_normalized]
+            # (GTDB metadata uses GB_/RS_ prefix)
+            original_acc = original_accession.get(acc)
 
             if original_acc:
                 taxonomy = parts[tax_idx] if tax_idx and len(parts) > tax_idx else ""
 
                 # Parse taxonomy to get phylum
-                phylum = ""
-                if taxonomy:
-                    tax_parts = taxonomy.split(';')
-                    for part in tax_parts:
-                        if part.startswith('p__'):
-                            phylum = part[3:]
-                            break
+                match = PHYLUM_PATTERN.search(taxonomy)
+                phylum = match.group(1) if match else ""
 
                 try:
                     completeness = float(parts[comp_idx]) if comp_idx and len(parts) > comp_idx and parts[comp_idx] else 0
@@ -218,12 +286,14 @@ def load_metadata(metadata_file, accessions_of_interest):
 
 def select_balanced(prophage_free, metadata, n_select):
     """Select genomes balanced across phyla."""
-    # Group by phylum
+    # Group by phylum, scoring quality (completeness - contamination) once per genome
     by_phylum = defaultdict(list)
+    quality = {}
     for acc in prophage_free:
         if acc in metadata:
-            phylum = metadata[acc]['phylum'] or 'Unknown'
-            by_phylum[phylum].append(acc)
+            m = metadata[acc]
+            by_phylum[m['phylum'] or 'Unknown'].append(acc)
+            quality[acc] = m['completeness'] - m['contamination']
 
     print(f"\nPhyla distribution of prophage-free genomes:")
     for phylum, accs in sorted(by_phylum.items(), key=lambda x: -len(x[1])):
@@ -242,25 +312,25 @@ def select_balanced(prophage_free, metadata, n_select):
 
     # Adjust to hit target
     total_allocated = sum(allocations.values())
-    while total_allocated < n_select:
-        # Add one more from the largest available phylum
-        for phylum in sorted(by_phylum.keys(), key=lambda x: -len(by_phylum[x])):
-            if allocations[phylum] < len(by_phylum[phylum]):
-                allocations[phylum] += 1
-                total_allocated += 1
-                break
-        else:
-            break  # No more available
-
-    while total_allocated > n_select:
-        # Remove one from the smallest allocation (if > 1)
-        for phylum in sorted(allocations.keys(), key=lambda x: allocations[x]):
-            if allocations[phylum] > 1:
-                allocations[phylum] -= 1
-                total_allocated -= 1
-                break
-        else:
+
+    # Top up from the largest phyla first, filling each before the next
+    for phylum in sorted(by_phylum.keys(), key=lambda x: -len(by_phylum[x])):
+        if total_allocated >= n_select:
             break
+        extra = min(len(by_phylum[phylum]) - allocations[phylum], n_select - total_allocated)
+        allocations[phylum] += extra
+        total_allocated += extra
+
+    # Remove one at a time from the smallest allocation (if > 1); ties go to
+    # the phylum seen first
+    trimmable = [(n, i, phylum) for i, (phylum, n) in enumerate(allocations.items()) if n > 1]
+    heapq.heapify(trimmable)
+    while total_allocated > n_select and trimmable:
+        n, i, phylum = heapq.heappop(trimmable)
+        allocations[phylum] -= 1
+        total_allocated -= 1
+        if n - 1 > 1:
+            heapq.heappush(trimmable, (n - 1, i, phylum))
 
     # Select from each phylum
     import random
@@ -268,12 +338,8 @@ def select_balanced(prophage_free, metadata, n_select):
 
     for phylum, n in allocations.items():
         accs = by_phylum[phylum]
-        # Sort by quality (completeness - contamination) and pick top n
-        accs_sorted = sorted(accs,
-                            key=lambda x: metadata.get(x, {}).get('completeness', 0) -
-                                         metadata.get(x, {}).get('contamination', 0),
-                            reverse=True)
-        selected.extend(accs_sorted[:n])
+        # Pick the top n by quality without a full sort
+        selected.extend(heapq.nlargest(n, accs, key=quality.__getitem__))
 
     return selected[:n_select]
 
@@ -293,38 +359,34 @@ def main():
 
     # Load accessions to consider
     print(f"\nLoading accessions from {args.accessions}...")
-    all_accessions, orig_to_norm, norm_to_orig = load_accessions(args.accessions)
+    all_accessions = load_accessions(args.accessions)
     print(f"  Loaded {len(all_accessions):,} accessions")
 
-    # Create set of normalized accessions for comparison
-    all_accessions_normalized = set(orig_to_norm.values())
-
     # Find genomes with significant BLAST hits (≥90% identity AND ≥200bp)
     MIN_IDENTITY = 90.0
     MIN_LENGTH = 200
     print(f"\nScanning BLAST results from {args.blast_results}...")
     print(f"  Filtering: identity ≥{MIN_IDENTITY}% AND length ≥{MIN_LENGTH}bp")
     genomes_with_hits = find_genomes_with_hits(args.blast_results, contig_to_genome,
-                                                min_identity=MIN_IDENTITY, min_length=MIN_LENGTH)
+                                                min_identity=MIN_IDENTITY, min_length=MIN_LENGTH,
+                                                threads=args.threads)
     print(f"  Found {len(genomes_with_hits):,} unique genomes with significant phage hits")
 
     # Debug: show sample accessions
     print(f"\n  Sample genomes with hits: {list(genomes_with_hits)[:3]}")
-    print(f"  Sample test accessions (normalized): {list(all_accessions_normalized)[:3]}")
+    print(f"  Sample test accessions (normalized): {[normalize_accession(acc) for acc in islice(all_accessions, 3)]}")
 
-    # Find overlap between genomes with hits and our test set
-    test_with_hits = all_accessions_normalized & genomes_with_hits
-    print(f"  Test genomes with phage hits: {len(test_with_hits):,}")
+    # genomes_with_hits are in GCA_/GCF_ format; adding the GB_/RS_ prefixed
+    # forms once lets test accessions be checked without normalizing each one
+    hits_any_prefix = genomes_with_hits.union(
+        *({prefix + acc for acc in genomes_with_hits} for prefix in GTDB_PREFIXES)
+    )
 
-    # Find prophage-free genomes using normalized accessions
-    # genomes_with_hits are in GCA_/GCF_ format, all_accessions_normalized is also in that format
-    prophage_free_normalized = all_accessions_normalized - genomes_with_hits
+    # Find prophage-free genomes, keeping accessions in their original format
+    prophage_free = {acc for acc in all_accessions if acc not in hits_any_prefix}
 
-    # Convert back to original format
-    prophage_free = set()
-    for norm_acc in prophage_free_normalized:
-        if norm_acc in norm_to_orig:
-            prophage_free.add(norm_to_orig[norm_acc])
+    # Find overlap between genomes with hits and our test set
+    print(f"  Test genomes with phage hits: {len(all_accessions) - len(prophage_free):,}")
 
     print(f"\nProphage-free genomes (ZERO hits): {len(prophage_free):,}")
     print(f"  ({len(prophage_free)/len(all_accessions)*100:.1f}% of test set)")
@@ -338,22 +400,24 @@ def main():
               f"requested {args.n_select}")
         args.n_select = len(prophage_free)
 
-    # Load metadata for selection
-    print(f"\nLoading metadata from {args.metadata}...")
-    metadata = load_metadata(args.metadata, prophage_free)
-    print(f"  Loaded metadata for {len(metadata):,} genomes")
-
     # Select genomes
+    if not args.balance_taxonomy:
+        # Random sample; sorted first so the seed alone fixes the selection
+        import random
+        selected = random.Random(42).sample(sorted(prophage_free), args.n_select)
+
+    # Balanced selection needs metadata for every candidate; otherwise it is
+    # only needed for the selected genomes written to --output-metadata
+    metadata = {}
+    if args.balance_taxonomy or args.output_metadata:
+        print(f"\nLoading metadata from {args.metadata}...")
+        metadata = load_metadata(args.metadata,
+                                 prophage_free if args.balance_taxonomy else selected)
+        print(f"  Loaded metadata for {len(metadata):,} genomes")
+
     if args.balance_taxonomy:
         print(f"\nSelecting {args.n_select} balanced across phyla...")
         selected = select_balanced(prophage_free, metadata, args.n_select)
-    else:
-        # Just take first n (or random)
-        import random
-        random.seed(42)
-        selected = list(prophage_free)
-        random.shuffle(selected)
-        selected = selected[:args.n_select]
 
     print(f"\nSelected {len(selected)} prophage-free genomes")
 
@@ -361,22 +425,23 @@ def main():
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
+    selected_sorted = sorted(selected)
     with open(output_path, 'w') as f:
-        for acc in sorted(selected):
-            f.write(f"{acc}\n")
+        f.write(''.join(f"{acc}\n" for acc in selected_sorted))
     print(f"\nWrote accessions to {args.output}")
 
     # Write metadata if requested
     if args.output_metadata:
+        rows = ["accession\tphylum\tcompleteness\tcontamination\tgenome_size\ttaxonomy\n"]
+        for acc in selected_sorted:
+            if acc in metadata:
+                m = metadata[acc]
+                rows.append(f"{acc}\t{m['phylum']}\t{m['completeness']:.2f}\t"
+                            f"{m['contamination']:.2f}\t{m['genome_size']}\t{m['taxonomy']}\n")
+            else:
+                rows.append(f"{acc}\t\t\t\t\t\n")
         with open(args.output_metadata, 'w') as f:
-            f.write("accession\tphylum\tcompleteness\tcontamination\tgenome_size\ttaxonomy\n")
-            for acc in sorted(selected):
-                if acc in metadata:
-                    m = metadata[acc]
-                    f.write(f"{acc}\t{m['phylum']}\t{m['completeness']:.2f}\t"
-                           f"{m['contamination']:.2f}\t{m['genome_size']}\t{m['taxonomy']}\n")
-                else:
-                    f.write(f"{acc}\t\t\t\t\t\n")
+            f.write(''.join(rows))
         print(f"Wrote metadata to {args.output_metadata}")
 
     # Summary
@@ -390,13 +455,12 @@ def main():
 
     if args.balance_taxonomy and metadata:
         # Show phylum distribution of selected
-        phylum_counts = defaultdict(int)
-        for acc in selected:
-            if acc in metadata:
-                phylum_counts[metadata[acc]['phylum'] or 'Unknown'] += 1
+        phylum_counts = Counter(
+            metadata[acc]['phylum'] or 'Unknown' for acc in selected if acc in metadata
+        )
 
         print(f"\nPhylum distribution of selected {len(selected)} genomes:")
-        for phylum, count in sorted(phylum_counts.items(), key=lambda x: -x[1]):
+        for phylum, count in phylum_counts.most_common():
             print(f"  {phylum}: {count}")
 
 
@@ -6,10 +6,16 @@ Creates a combined dataset with labels for binary classification.
 """
 
 import argparse
+import mmap
+import os
 import random
 from pathlib import Path
 
 
+# Output buffer for the merged FASTA and labels files
+WRITE_BUFFER_SIZE = 1 << 20
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Merge and shuffle phage/bacteria segment datasets"
@@ -53,37 +59,57 @@ def parse_args():
     return parser.parse_args()
 
 
-def read_fasta(fasta_file):
-    """Read FASTA file and return list of (header, sequence) tuples."""
-    sequences = []
-    current_header = None
-    current_seq = []
-
-    with open(fasta_file, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if line.startswith('>'):
-                if current_header is not None:
-                    sequences.append((current_header, ''.join(current_seq)))
-                current_header = line[1:]  # Remove '>'
-                current_seq = []
+def index_fasta(fasta_file):
+    """Index a FASTA file as a list of (header, seq_start, seq_end) tuples.
+
+    Only headers and the byte range of each sequence are kept in memory;
+    sequences are read back with read_sequence when they are written.
+    """
+    records = []
+
+    with open(fasta_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return records
+
+        # Record boundaries are found with mmap.find rather than a per-line loop
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Skip anything before the first record
+            if mm[:1] == b'>':
+                start = 0
             else:
-                current_seq.append(line)
+                start = mm.find(b'\n>')
+                if start != -1:
+                    start += 1
+
+            while start != -1:
+                next_record = mm.find(b'\n>', start)
+                stop = len(mm) if next_record == -1 else next_record
+                header_end = mm.find(b'\n', start, stop)
+                if header_end == -1:
+                    header_end = stop
+
+                header = mm[start + 1:header_end].rstrip().decode()  # Remove '>'
+                records.append((header, header_end, stop))
+
+                start = next_record + 1 if next_record != -1 else -1
+
+    return records
 
-        # Don't forget the last sequence
-        if current_header is not None:
-            sequences.append((current_header, ''.join(current_seq)))
 
-    return sequences
+def read_sequence(f, seq_start, seq_end):
+    """Read one indexed sequence (bytes) from an open binary file, without line breaks."""
+    f.seek(seq_start)
+    return b''.join(f.read(seq_end - seq_start).split())
 
 
 def write_fasta(sequences, output_file):
-    """Write sequences to FASTA file with 80-char line wrapping."""
-    with open(output_file, 'w') as f:
+    """Write (header, sequence bytes) pairs to FASTA file with 80-char line wrapping."""
+    with open(output_file, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
         for header, seq in sequences:
-            f.write(f">{header}\n")
-            for i in range(0, len(seq), 80):
-                f.write(f"{seq[i:i+80]}\n")
+            # Wrap with a single join over 80-base slices instead of a write per line
+            f.write(b'>' + header.encode() + b'\n')
+            if seq:
+                f.write(b'\n'.join([seq[i:i + 80] for i in range(0, len(seq), 80)]) + b'\n')
 
 
 def main():
@@ -102,23 +128,21 @@ def main():
     print(f"Seed: {args.seed}")
     print()
 
-    # Read phage sequences
+    # Index phage sequences
     print(f"Reading phage sequences...")
-    phage_seqs = read_fasta(args.phage_fasta)
-    print(f"  Loaded {len(phage_seqs):,} phage segments")
+    phage_records = index_fasta(args.phage_fasta)
+    print(f"  Loaded {len(phage_records):,} phage segments")
 
-    # Read bacteria sequences
+    # Index bacteria sequences
     print(f"Reading bacteria sequences...")
-    bacteria_seqs = read_fasta(args.bacteria_fasta)
-    print(f"  Loaded {len(bacteria_seqs):,} bacteria segments")
+    bacteria_records = index_fasta(args.bacteria_fasta)
+    print(f"  Loaded {len(bacteria_records):,} bacteria segments")
 
-    # Create combined list with labels
-    # Each entry: (header, sequence, label, source)
-    combined = []
-    for header, seq in phage_seqs:
-        combined.append((header, seq, args.phage_label, "inphared"))
-    for header, seq in bacteria_seqs:
-        combined.append((header, seq, args.bacteria_label, "gtdb"))
+    # Create combined index with labels
+    # Each entry: (source index, header, seq_start, seq_end)
+    sources = [(args.phage_label, "inphared"), (args.bacteria_label, "gtdb")]
+    combined = [(0, *record) for record in phage_records]
+    combined.extend((1, *record) for record in bacteria_records)
 
     print(f"\nTotal combined: {len(combined):,} segments")
 
@@ -126,26 +150,34 @@ def main():
     print(f"Shuffling with seed {args.seed}...")
     random.shuffle(combined)
 
-    # Write output FASTA
+    # Write output FASTA, streaming each sequence from its source file
     print(f"\nWriting merged FASTA to {output_fasta}...")
-    sequences_only = [(header, seq) for header, seq, _, _ in combined]
-    write_fasta(sequences_only, output_fasta)
+    with open(args.phage_fasta, 'rb') as phage_f, open(args.bacteria_fasta, 'rb') as bacteria_f:
+        handles = [phage_f, bacteria_f]
+        write_fasta(
+            ((header, read_sequence(handles[source], seq_start, seq_end))
+             for source, header, seq_start, seq_end in combined),
+            output_fasta,
+        )
 
     # Write labels file
     print(f"Writing labels to {output_labels}...")
-    with open(output_labels, 'w') as f:
+    label_lines = []
+    for source, header, _, _ in combined:
+        label, source_name = sources[source]
+        # Extract just the ID part (before any space)
+        segment_id = header.split()[0]
+        label_lines.append(f"{segment_id}\t{label}\t{source_name}\n")
+    with open(output_labels, 'w', buffering=WRITE_BUFFER_SIZE) as f:
         f.write("segment_id\tlabel\tsource\n")
-        for header, _, label, source in combined:
-            # Extract just the ID part (before any space)
-            segment_id = header.split()[0]
-            f.write(f"{segment_id}\t{label}\t{source}\n")
+        f.write(''.join(label_lines))
 
     # Print summary
     print(f"\nSummary:")
-    print(f"  Phage segments: {len(phage_seqs):,} ({args.phage_label})")
-    print(f"  Bacteria segments: {len(bacteria_seqs):,} ({args.bacteria_label})")
+    print(f"  Phage segments: {len(phage_records):,} ({args.phage_label})")
+    print(f"  Bacteria segments: {len(bacteria_records):,} ({args.bacteria_label})")
     print(f"  Total segments: {len(combined):,}")
-    print(f"  Balance: {len(phage_seqs)/len(combined)*100:.1f}% phage, {len(bacteria_seqs)/len(combined)*100:.1f}% bacteria")
+    print(f"  Balance: {len(phage_records)/len(combined)*100:.1f}% phage, {len(bacteria_records)/len(combined)*100:.1f}% bacteria")
 
     print(f"\nDone!")
 
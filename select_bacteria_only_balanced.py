@@ -7,14 +7,19 @@ being biased toward well-represented taxa.
 """
 
 import argparse
+import functools
+import heapq
 import random
-import re
 from pathlib import Path
 from collections import defaultdict
 
 import pandas as pd
 
 
+# GTDB metadata columns used for selection; the remaining columns are skipped
+METADATA_COLUMNS = ['accession', 'gtdb_taxonomy']
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description="Select taxonomically balanced bacteria for Bacteria-Only benchmark"
@@ -49,11 +54,15 @@ def parse_args():
     return parser.parse_args()
 
 
-def extract_taxonomy_level(taxonomy_string, level):
-    """Extract a specific taxonomy level from GTDB taxonomy string."""
-    pattern = f'{level}__([^;]*)'
-    match = re.search(pattern, taxonomy_string)
-    return match.group(1) if match else "Unknown"
+def extract_taxonomy_level(taxonomy, level):
+    """Extract a specific taxonomy level from a Series of GTDB taxonomy strings."""
+    return taxonomy.str.extract(f'{level}__([^;]*)', expand=False).fillna("Unknown")
+
+
+@functools.lru_cache(maxsize=None)
+def sample_position(n_rows, seed):
+    """Return the row position DataFrame.sample(n=1, random_state=seed) picks from n_rows rows."""
+    return int(pd.RangeIndex(n_rows).to_series().sample(n=1, random_state=seed).iloc[0])
 
 
 def main():
@@ -69,24 +78,24 @@ def main():
     # Load test accessions
     print(f"\nLoading test accessions from {args.accessions}...")
     with open(args.accessions, 'r') as f:
-        test_accessions = set(line.strip() for line in f if line.strip())
+        test_accessions = {acc for acc in map(str.strip, f) if acc}
     print(f"  Test accessions: {len(test_accessions)}")
 
     # Load GTDB metadata
     print(f"\nLoading GTDB metadata from {args.metadata}...")
-    df = pd.read_csv(args.metadata, sep='\t', low_memory=False)
+    df = pd.read_csv(args.metadata, sep='\t', usecols=METADATA_COLUMNS, dtype=str)
     print(f"  Total genomes in metadata: {len(df)}")
 
     # Filter to test accessions only
-    df_test = df[df['accession'].isin(test_accessions)].copy()
+    df_test = df[df['accession'].isin(test_accessions)].reset_index(drop=True)
     print(f"  Matched test accessions: {len(df_test)}")
 
     # Extract taxonomy
-    df_test['phylum'] = df_test['gtdb_taxonomy'].apply(lambda x: extract_taxonomy_level(x, 'p'))
-    df_test['class'] = df_test['gtdb_taxonomy'].apply(lambda x: extract_taxonomy_level(x, 'c'))
-    df_test['order'] = df_test['gtdb_taxonomy'].apply(lambda x: extract_taxonomy_level(x, 'o'))
-    df_test['family'] = df_test['gtdb_taxonomy'].apply(lambda x: extract_taxonomy_level(x, 'f'))
-    df_test['genus'] = df_test['gtdb_taxonomy'].apply(lambda x: extract_taxonomy_level(x, 'g'))
+    df_test['phylum'] = extract_taxonomy_level(df_test['gtdb_taxonomy'], 'p')
+    df_test['class'] = extract_taxonomy_level(df_test['gtdb_taxonomy'], 'c')
+    df_test['order'] = extract_taxonomy_level(df_test['gtdb_taxonomy'], 'o')
+    df_test['family'] = extract_taxonomy_level(df_test['gtdb_taxonomy'], 'f')
+    df_test['genus'] = extract_taxonomy_level(df_test['gtdb_taxonomy'], 'g')
 
     # Show taxonomy distribution
     print(f"\nTaxonomy distribution in test set:")
@@ -107,8 +116,7 @@ def main():
 
     # Calculate proportional selection per phylum
     total_genomes = len(df_test)
-    selected = []
-    selected_accessions = set()
+    selected_idx = []
 
     # First pass: proportional selection from each phylum (minimum 1 per phylum if possible)
     phylum_allocations = {}
@@ -122,31 +130,54 @@ def main():
         phylum_allocations[phylum] = allocation
         remaining -= allocation
 
-    # Adjust if we over-allocated
-    while sum(phylum_allocations.values()) > n_target:
-        # Reduce from largest allocations
-        max_phylum = max(phylum_allocations, key=phylum_allocations.get)
-        if phylum_allocations[max_phylum] > 1:
-            phylum_allocations[max_phylum] -= 1
-
-    # Adjust if we under-allocated (add to largest phyla)
-    while sum(phylum_allocations.values()) < n_target:
-        for phylum in phylum_counts.index:
-            if sum(phylum_allocations.values()) >= n_target:
+    # Adjust if we over-allocated: remove one at a time from the largest
+    # allocation (if > 1); ties go to the phylum seen first
+    total_allocated = sum(phylum_allocations.values())
+    trimmable = [(-n, i, phylum) for i, (phylum, n) in enumerate(phylum_allocations.items()) if n > 1]
+    heapq.heapify(trimmable)
+    while total_allocated > n_target and trimmable:
+        n, i, phylum = heapq.heappop(trimmable)
+        phylum_allocations[phylum] -= 1
+        total_allocated -= 1
+        if -n - 1 > 1:
+            heapq.heappush(trimmable, (n + 1, i, phylum))
+
+    # Adjust if we under-allocated: add one per round to each phylum with
+    # genomes left, largest phyla first. Full rounds are added at once, then
+    # the last partial round goes to the largest phyla with room
+    room = {phylum: phylum_counts[phylum] - phylum_allocations[phylum] for phylum in phylum_counts.index}
+    shortfall = min(n_target - total_allocated, sum(room.values()))
+    if shortfall > 0:
+        lo, hi = 0, max(room.values())
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if sum(min(r, mid) for r in room.values()) <= shortfall:
+                lo = mid
+            else:
+                hi = mid - 1
+        for phylum, r in room.items():
+            phylum_allocations[phylum] += min(r, lo)
+            shortfall -= min(r, lo)
+        for phylum, r in room.items():
+            if shortfall == 0:
                 break
-            if phylum_allocations[phylum] < phylum_counts[phylum]:
+            if r > lo:
                 phylum_allocations[phylum] += 1
+                shortfall -= 1
 
     print(f"\n  Allocation per phylum:")
-    for phylum, alloc in sorted(phylum_allocations.items(), key=lambda x: -x[1])[:15]:
+    for phylum, alloc in heapq.nlargest(15, phylum_allocations.items(), key=lambda x: x[1]):
         available = phylum_counts[phylum]
         print(f"    {phylum}: {alloc} (of {available} available)")
     if len(phylum_allocations) > 15:
         print(f"    ... and {len(phylum_allocations) - 15} more phyla")
 
-    # Select genomes from each phylum
+    # Select genomes from each phylum; row positions are grouped once by
+    # phylum and by (phylum, genus) instead of masking the frame per group
+    phylum_groups = df_test.groupby('phylum', sort=False)
+    genus_positions = df_test.groupby(['phylum', 'genus'], sort=False).indices
     for phylum, n_select in phylum_allocations.items():
-        phylum_genomes = df_test[df_test['phylum'] == phylum]
+        phylum_genomes = phylum_groups.get_group(phylum)
 
         # Try to get diversity within phylum by selecting from different genera
         genera = phylum_genomes['genus'].unique()
@@ -155,18 +186,15 @@ def main():
             # Select one per genus until we have enough
             selected_genera = random.sample(list(genera), n_select)
             for genus in selected_genera:
-                genus_genomes = phylum_genomes[phylum_genomes['genus'] == genus]
-                chosen = genus_genomes.sample(n=1, random_state=args.seed).iloc[0]
-                selected.append(chosen)
-                selected_accessions.add(chosen['accession'])
+                positions = genus_positions[(phylum, genus)]
+                selected_idx.append(positions[sample_position(len(positions), args.seed)])
         else:
             # Not enough genera, select randomly from phylum
             chosen_rows = phylum_genomes.sample(n=n_select, random_state=args.seed)
-            for _, row in chosen_rows.iterrows():
-                selected.append(row)
-                selected_accessions.add(row['accession'])
+            selected_idx.extend(chosen_rows.index)
 
-    selected_df = pd.DataFrame(selected)
+    # Gather all selected rows in one step
+    selected_df = df_test.iloc[selected_idx]
     print(f"\n  Selected: {len(selected_df)} genomes")
     print(f"  Phyla represented: {selected_df['phylum'].nunique()}")
     print(f"  Genera represented: {selected_df['genus'].nunique()}")
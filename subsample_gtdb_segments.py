@@ -267,7 +267,7 @@ def main():
 
     # Load accession list
     with open(args.accession_list, 'r') as f:
-        accessions = [line.strip() for line in f if line.strip()]
+        accessions = [acc for acc in map(str.strip, f) if acc]
 
     print(f"GTDB Segment Subsampling")
     print(f"=" * 50)
@@ -156,7 +156,7 @@ def main():
 
     # Load accession list
     with open(args.accession_list, 'r') as f:
-        accessions = [line.strip() for line in f if line.strip()]
+        accessions = [acc for acc in map(str.strip, f) if acc]
 
     accession_set = set(accessions)
 
@@ -0,0 +1,68 @@
+"""Regression tests for calculate_prophage_metrics.py."""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import calculate_prophage_metrics as cpm
+
+
+def brute_force_counts(true_regions, pred_regions, genome_length):
+    """Count TP/TN/FP/FN with explicit position sets."""
+    true_positions = {p for start, end in true_regions for p in range(start, end + 1)}
+    pred_positions = {p for start, end in pred_regions for p in range(start, end + 1)}
+    all_positions = set(range(1, genome_length + 1))
+    return (
+        len(true_positions & pred_positions),
+        len(all_positions - true_positions - pred_positions),
+        len(pred_positions - true_positions),
+        len(true_positions - pred_positions),
+    )
+
+
+class CalculateGenomeMetricsTest(unittest.TestCase):
+
+    def assert_counts(self, true_regions, pred_regions, genome_length):
+        metrics = cpm.calculate_genome_metrics(true_regions, pred_regions, genome_length)
+        self.assertEqual(
+            (metrics['TP'], metrics['TN'], metrics['FP'], metrics['FN']),
+            brute_force_counts(true_regions, pred_regions, genome_length),
+        )
+
+    def test_overlapping_regions(self):
+        self.assert_counts([(10, 50), (40, 80)], [(30, 60), (90, 95)], 100)
+
+    def test_reversed_region_is_empty(self):
+        # (70, 20) covers nothing and must not cancel the real coverage
+        self.assert_counts([(10, 50), (70, 20)], [(30, 60)], 100)
+        self.assert_counts([(10, 50)], [(30, 60), (90, 5)], 100)
+
+    def test_no_regions(self):
+        self.assert_counts([], [], 100)
+
+
+class LoadGroundTruthTest(unittest.TestCase):
+
+    def test_missing_like_ids_are_kept_as_strings(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = Path(tmp) / "ground_truth.csv"
+            csv_path.write_text(
+                "NCBI Id,start,end\n"
+                "NC_000001.1,1,10\n"
+                ",5,8\n"
+                "NA,2,3\n"
+                "NaN,4,6\n"
+            )
+            regions = cpm.load_ground_truth(csv_path)
+
+        self.assertEqual([tuple(r) for r in regions['NC_000001']], [(1, 10)])
+        self.assertEqual([tuple(r) for r in regions['']], [(5, 8)])
+        self.assertEqual([tuple(r) for r in regions['NA']], [(2, 3)])
+        self.assertEqual([tuple(r) for r in regions['NaN']], [(4, 6)])
+
+
+if __name__ == "__main__":
+    unittest.main()